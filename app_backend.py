@@ -1,20 +1,35 @@
 # app_backend.py
 import os
+import hmac
 import json
+import time
 import base64
-from datetime import datetime
-import re
-import random
+import asyncio
+import threading
+import contextlib
 
-import requests
-from flask import Flask, jsonify, request, render_template
-from msal import PublicClientApplication
+from flask import Flask, Response, g, jsonify, request, render_template, send_file, stream_with_context
 from dotenv import load_dotenv
-from perplexity import Perplexity
+from perplexity import AsyncPerplexity
 from pymongo import MongoClient
-from bson import ObjectId
 
-from get_authentication import load_cache, get_token
+import async_io
+import metrics
+from get_authentication import GraphAuthError, TokenProvider
+from notes_index import NotesIndex, iter_local_documents, local_document_version
+from chunk_store import ChunkStore
+from docx_text import extract_docx_text
+from summary_cache import SummaryCache, summary_cache_key
+from document_cache import DocumentCache
+from notes_sync import sync_notes_metadata
+from notes_catalog import NotesCatalog
+from graph_client import GraphClient
+from context_packer import pack_context, estimate_tokens, truncate_to_tokens
+from thread_store import ThreadStore
+from eliza import ElizaEngine
+from search_cache import SearchCache
+from suggest_index import SuggestIndex
+from profiler import DeterministicProfiler, ProfileStore, SamplingProfiler, verify_signature
 
 load_dotenv()
 
@@ -29,149 +44,391 @@ AUTHORITY = "https://login.microsoftonline.com/common"
 SCOPES = ["Files.Read.All"]
 CACHE_FILE = os.path.join(os.path.dirname(__file__), "token_cache.bin")
 ONEDRIVE_DOCUMENTS_FOLDER_ID = os.getenv("ONEDRIVE_DOCUMENTS_FOLDER_ID")
+GRAPH_PAGE_SIZE = int(os.getenv("GRAPH_PAGE_SIZE") or 50)  # $top for paged Graph queries
+
+# one MSAL app + in-memory access token shared by every request
+TOKEN_PROVIDER = TokenProvider(cache_file=CACHE_FILE)
 
 # === Perplexity API configuration ===
 
 PERPLEXITY_API_KEY = os.getenv("PERPLEXITY_API_KEY")
-PPLX_CLIENT = Perplexity(api_key=PERPLEXITY_API_KEY, base_url="https://api.perplexity.ai")
+PERPLEXITY_BASE_URL = os.getenv("PERPLEXITY_BASE_URL") or "https://api.perplexity.ai"
+# async client on the shared connection pool; call it through async_io.run / iter_async
+PPLX_CLIENT = AsyncPerplexity(
+    api_key=PERPLEXITY_API_KEY,
+    base_url=PERPLEXITY_BASE_URL,
+    http_client=async_io.get_client(),
+)
+
+CHAT_MODEL = "sonar"
+SUMMARIZE_MODEL = "sonar"
+SUMMARIZE_PROMPT = (
+    "You are summarizing a set of Microsoft Word documents from my notes. "
+    "For each attached document, provide a short summary, then a brief overall summary."
+)
 
 # === MongoDB configuration (threads) ===
 
 MONGO_URL = os.getenv("MONGO_URL")
 mongo_client = MongoClient(MONGO_URL) if MONGO_URL else None
-db = mongo_client["chatbot_db"] if mongo_client else None
-threads_collection = db["threads"] if db else None  # {_id, title, conversations, created_at, updated_at}
+db = mongo_client["chatbot_db"] if mongo_client is not None else None
+THREAD_STORE = ThreadStore(db) if db is not None else None  # threads + per-turn messages
+THREAD_PAGE_SIZE = int(os.getenv("THREAD_PAGE_SIZE") or 50)  # turns returned per thread page
+THREADS_PAGE_SIZE = int(os.getenv("THREADS_PAGE_SIZE") or 30)  # threads per sidebar page
 
 # Notes metadata
 
 BASE_DIR = os.path.dirname(__file__)
-NOTES_METADATA_PATH = os.path.join(BASE_DIR, "notes_metadata.json")
-
-# === ELIZA implementation (from test_chat_eliza.py) ===
-
-REFLECTIONS = {
-    "am": "are",
-    "was": "were",
-    "i": "you",
-    "i'd": "you would",
-    "i've": "you have",
-    "i'll": "you will",
-    "my": "your",
-    "you": "me",
-    "you're": "I'm",
-    "you've": "I've",
-    "you'll": "I'll",
-    "your": "my",
-    "yours": "mine",
-    "me": "you",
-}
+NOTES_METADATA_PATH = os.getenv("NOTES_METADATA_PATH") or os.path.join(BASE_DIR, "notes_metadata.json")
+# saved Graph deltaLink
+NOTES_DELTA_STATE_PATH = os.getenv("NOTES_DELTA_STATE_PATH") or os.path.join(BASE_DIR, "notes_delta.json")
+# .docx copies from download_all_notes.py
+NOTE_FILES_DIR = os.getenv("NOTE_FILES_DIR") or os.path.join(BASE_DIR, "note_files")
+# rewritten by download_all_notes.py after each file it saves
+NOTE_FILES_MANIFEST_PATH = os.path.join(NOTE_FILES_DIR, "manifest.json")
+
+# Notes catalog: in-memory, indexed by id/name, reloaded when the file changes
+
+NOTES_CATALOG = NotesCatalog(NOTES_METADATA_PATH)
+
+# Local full-text search index over note contents (Graph search is the fallback)
+
+NOTES_INDEX = NotesIndex()
+NOTES_INDEX_LOCK = threading.Lock()
+NOTES_INDEX_SOURCES = [None]  # notes_sources_signature() of the last rebuild
+INDEXED_VERSIONS = {}  # note id -> local_document_version() it was indexed at
+
+# Search responses kept in memory for repeated (normalized) queries; cleared
+# when the notes catalog or the local index changes
+
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES") or 1000)
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS") or 300)
+SEARCH_CACHE = SearchCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS)
+# set to 1 to write each raw Graph search response to output/query_result.json
+SEARCH_DEBUG_DUMP = (os.getenv("SEARCH_DEBUG_DUMP") or "").lower() in ("1", "true", "yes")
+
+# Typeahead over note names and the most frequent indexed terms
+
+SUGGEST_INDEX = SuggestIndex()
+SUGGEST_MAX_TERMS = int(os.getenv("SUGGEST_MAX_TERMS") or 20000)
+
+# Passage store for chat retrieval: only the top-k passages go to the LLM
+
+CHUNK_STORE = ChunkStore()
+CHAT_TOP_K_PASSAGES = int(os.getenv("CHAT_TOP_K_PASSAGES") or 6)
+
+# On-disk cache of downloaded .docx bytes, keyed by item id + cTag/eTag
+
+DOCUMENT_CACHE_DIR = os.getenv("DOCUMENT_CACHE_DIR") or os.path.join(BASE_DIR, "document_cache")
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES") or 1024 * 1024 * 1024)
+DOCUMENT_CACHE = DocumentCache(DOCUMENT_CACHE_DIR, DOCUMENT_CACHE_MAX_BYTES)
+
+# Extracted note text, cached per item id + cTag/eTag like the .docx bytes
+
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR") or os.path.join(BASE_DIR, "text_cache")
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES") or 256 * 1024 * 1024)
+TEXT_CACHE = DocumentCache(TEXT_CACHE_DIR, TEXT_CACHE_MAX_BYTES)
+
+# Summaries keyed by the (id, cTag/eTag) set of the notes plus prompt and model
+
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH") or os.path.join(BASE_DIR, "summary_cache.json")
+SUMMARY_CACHE_TTL_SECONDS = int(os.getenv("SUMMARY_CACHE_TTL_SECONDS") or 7 * 24 * 3600)
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES") or 500)
+SUMMARY_CACHE = SummaryCache(SUMMARY_CACHE_PATH, SUMMARY_CACHE_TTL_SECONDS, SUMMARY_CACHE_MAX_ENTRIES)
+
+# "text" sends the extracted note text to the LLM, "file" the base64 .docx
+ATTACHMENT_MODE = os.getenv("ATTACHMENT_MODE") or "text"
+# chat additionally supports "passages": only the most relevant passages
+CHAT_ATTACHMENT_MODE = os.getenv("CHAT_ATTACHMENT_MODE") or "passages"
+
+# Max attachments of one request fetched in parallel
+
+ATTACHMENT_FETCH_WORKERS = int(os.getenv("ATTACHMENT_FETCH_WORKERS") or 8)
+
+# Estimated tokens of note content + question sent in one LLM request; a
+# request may ask for less with "token_budget" but never for more
+
+LLM_CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET") or 12000)
+# total base64 size of the .docx files sent in "file" attachment mode; files
+# past it are dropped (and reported), so request size stays bounded
+LLM_FILE_ATTACHMENT_BUDGET_BYTES = int(os.getenv("LLM_FILE_ATTACHMENT_BUDGET_BYTES") or 32 * 1024 * 1024)
+
+# Thread history sent with a chat message: the latest turns verbatim plus a
+# running summary of everything older, kept on the thread document
+
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS") or 4)
+# older turns are folded into the summary once this many have piled up
+CHAT_HISTORY_SUMMARY_BATCH = int(os.getenv("CHAT_HISTORY_SUMMARY_BATCH") or 4)
+# share of the token budget the history may take
+CHAT_HISTORY_BUDGET_SHARE = 0.3
+# each old message is cut to this many tokens before it is summarized
+HISTORY_SUMMARY_MESSAGE_TOKENS = 500
+HISTORY_SUMMARY_PROMPT = (
+    "You keep a running summary of a conversation between me and an assistant "
+    "that answers questions about my notes. Update the summary below with the "
+    "new turns. Keep names, facts, decisions and open questions, stay under "
+    "200 words, and reply with the summary only."
+)
+
+# === ELIZA implementation (rules in eliza_rules.json, engine in eliza.py) ===
+
+ELIZA_RULES_PATH = os.getenv("ELIZA_RULES_PATH") or os.path.join(BASE_DIR, "eliza_rules.json")
+ELIZA = ElizaEngine.load(ELIZA_RULES_PATH)
+# max messages answered by one batch request to /api/eliza-chat
+ELIZA_MAX_BATCH = int(os.getenv("ELIZA_MAX_BATCH") or 1000)
 
 
 def reflect(fragment: str) -> str:
-    words = fragment.lower().split()
-    reflected = []
-    for w in words:
-        reflected.append(REFLECTIONS.get(w, w))
-    return " ".join(reflected)
-
-
-PAIRS = [
-    (r".*\babout\b(.*)", [
-        "What about %1?",
-        "How do you feel about %1?",
-        "Why are you thinking about %1 right now?",
-    ]),
-    (r"hi|hello|hey", [
-        "Hello. How are you feeling today?",
-        "Hi there. What would you like to talk about?"
-    ]),
-    (r"my name is (.*)", [
-        "Nice to meet you, %1.",
-        "Hello %1, how are you today?"
-    ]),
-    (r"i feel (.*)", [
-        "Why do you feel %1?",
-        "Do you often feel %1?",
-        "What makes you feel %1?"
-    ]),
-    (r"i am (.*)", [
-        "How long have you been %1?",
-        "Why do you say you are %1?"
-    ]),
-    (r"(.*)mother(.*)", [
-        "Tell me more about your mother.",
-        "How is your relationship with your mother?"
-    ]),
-    (r"(.*)father(.*)", [
-        "Tell me more about your father.",
-        "Do you get along with your father?"
-    ]),
-    (r"(.*)because (.*)", [
-        "Is that the real reason?",
-        "What other reasons come to mind?"
-    ]),
-    (r"(.*)\?", [
-        "Why do you ask that?",
-        "What do you think?",
-        "How would you answer that yourself?"
-    ]),
-    (r"(.*)", [
-        "Please tell me more.",
-        "Can you elaborate on that?",
-        "How does that make you feel?",
-        "Let's talk more about that."
-    ]),
-]
+    return ELIZA.reflect(fragment)
 
 
 def eliza_respond(text: str) -> str:
-    text = text.strip()
-    if not text:
-        return "Please go on."
-    for pattern, responses in PAIRS:
-        m = re.match(pattern, text, re.IGNORECASE)
-        if m:
-            response = random.choice(responses)
-            for i in range(1, len(m.groups()) + 1):
-                group = m.group(i)
-                response = response.replace(f"%{i}", reflect(group))
-            return response
-    return "Please go on."
+    return ELIZA.respond(text)
+
+
+# === Request profiling (opt-in) ===
+
+# endpoint names to profile every request of (e.g. "api_summarize"), or "all"
+PROFILE_REQUESTS = {name.strip() for name in (os.getenv("PROFILE_REQUESTS") or "").split(",") if name.strip()}
+# signs X-Profile headers (see profiler.sign_request) and guards /api/admin/profiles
+PROFILE_SECRET = os.getenv("PROFILE_SECRET") or ""
+PROFILE_MODE = os.getenv("PROFILE_MODE") or "sampling"  # or "cprofile"
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS") or 5)
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(BASE_DIR, "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES") or 50)
+PROFILE_STORE = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+
+
+# === Metrics (Prometheus text format at /metrics) ===
+
+METRICS = metrics.MetricsRegistry()
+HTTP_REQUEST_SECONDS = METRICS.histogram(
+    "http_request_duration_seconds",
+    "Time to build the response (streamed responses: until streaming starts).",
+    ["endpoint", "method", "status"],
+)
+HTTP_REQUEST_BYTES = METRICS.counter("http_request_bytes_total", "Request body bytes received.", ["endpoint"])
+HTTP_RESPONSE_BYTES = METRICS.counter(
+    "http_response_bytes_total", "Response body bytes sent (not counting streamed responses).", ["endpoint"]
+)
+DEPENDENCY_SECONDS = METRICS.histogram(
+    "dependency_duration_seconds",
+    "Time spent in each stage or dependency call made while serving an endpoint.",
+    ["endpoint", "dependency"],
+)
+DEPENDENCY_ERRORS = METRICS.counter(
+    "dependency_errors_total", "Stage or dependency calls that raised.", ["endpoint", "dependency"]
+)
+PAYLOAD_BYTES = METRICS.counter(
+    "payload_bytes_total",
+    "Bytes handled per kind: note_download, base64_output, llm_request (message content), llm_response.",
+    ["endpoint", "kind"],
+)
+METRICS.callback(
+    "search_cache_lookups_total", "SEARCH_CACHE lookups by result.", "counter",
+    lambda: {("hit",): SEARCH_CACHE.hits, ("miss",): SEARCH_CACHE.misses}, ["result"],
+)
+METRICS.callback(
+    "search_cache_entries", "Responses currently in SEARCH_CACHE.", "gauge",
+    lambda: {(): SEARCH_CACHE.stats()["entries"]},
+)
+METRICS.callback(
+    "graph_concurrency", "Graph requests in flight and the adaptive concurrency limit.", "gauge",
+    lambda: {("in_flight",): GRAPH.limiter.in_flight, ("limit",): int(GRAPH.limiter.limit)}, ["state"],
+)
+
+
+@contextlib.contextmanager
+def track_dependency(dependency: str):
+    """
+    Time the enclosed block as `dependency` of the current endpoint and
+    count it as an error if it raises. Works around awaits as well.
+    """
+    endpoint = metrics.ENDPOINT.get()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DEPENDENCY_ERRORS.inc(endpoint=endpoint, dependency=dependency)
+        raise
+    finally:
+        DEPENDENCY_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, dependency=dependency)
+
+
+def count_payload_bytes(kind: str, size: int):
+    PAYLOAD_BYTES.inc(size, endpoint=metrics.ENDPOINT.get(), kind=kind)
+
+
+def message_bytes(messages) -> int:
+    """Approximate size of chat messages: their text and base64 file contents."""
+    size = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            size += len(content)
+            continue
+        for block in content or []:
+            size += len(block.get("text") or block.get("file_url", {}).get("url") or "")
+    return size
+
+
+def complete_chat(model: str, messages, **kwargs):
+    """
+    PPLX_CLIENT chat completion from synchronous code, timed as the
+    "perplexity" dependency (for stream=True: until the stream is open).
+    """
+    count_payload_bytes("llm_request", message_bytes(messages))
+    with track_dependency("perplexity"):
+        return async_io.run(PPLX_CLIENT.chat.completions.create(model=model, messages=messages, **kwargs))
+
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    metrics.ENDPOINT.set(request.endpoint or "unmatched")
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get("metrics_start")
+    if start is None:
+        return response
+    endpoint = metrics.ENDPOINT.get()
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - start, endpoint=endpoint, method=request.method, status=str(response.status_code)
+    )
+    if request.content_length:
+        HTTP_REQUEST_BYTES.inc(request.content_length, endpoint=endpoint)
+    if not response.is_streamed and response.content_length:
+        HTTP_RESPONSE_BYTES.inc(response.content_length, endpoint=endpoint)
+    return response
+
+
+def should_profile() -> bool:
+    if (request.endpoint or "").startswith("api_admin_profiles"):
+        return False
+    if "all" in PROFILE_REQUESTS or request.endpoint in PROFILE_REQUESTS:
+        return True
+    return verify_signature(PROFILE_SECRET, request.headers.get("X-Profile"), request.method, request.path)
+
+
+def request_argument_sizes():
+    sizes = {
+        "query": {name: len(value) for name, value in request.args.items()},
+        "body_bytes": request.content_length or 0,
+    }
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        sizes["json"] = {
+            key: len(value) if isinstance(value, (str, list, dict)) else None for key, value in payload.items()
+        }
+    return sizes
+
+
+def finish_request_profile(active, status, error=None):
+    profiler, profile, start = active
+    profile.update(status=status, duration_s=round(time.perf_counter() - start, 6))
+    if error is not None:
+        profile["error"] = str(error)
+    profile["profile"] = profiler.stop()
+    try:
+        PROFILE_STORE.save(profile["name"], profile)
+    except OSError as e:
+        print(f"Saving request profile {profile['name']} failed: {e}")
+
+
+@app.before_request
+def start_request_profile():
+    """
+    Profile this request when PROFILE_REQUESTS covers its endpoint or it
+    carries a valid signed X-Profile header. When profiling is off this is
+    one set lookup and one header lookup.
+    """
+    if not PROFILE_REQUESTS and "X-Profile" not in request.headers:
+        return
+    if not should_profile():
+        return
+    if PROFILE_MODE == "cprofile":
+        profiler = DeterministicProfiler()
+    else:
+        # the request thread plus the async_io loop, where Graph/LLM calls run
+        threads = {"request": threading.get_ident(), "async-io": async_io.get_loop_thread_id()}
+        profiler = SamplingProfiler(threads, PROFILE_SAMPLE_INTERVAL_MS / 1000)
+    try:
+        profiler.start()
+    except ValueError:
+        return  # another cProfile is already running
+    started_at = time.time()
+    g.request_profile = (profiler, {
+        "name": PROFILE_STORE.new_name(request.endpoint or "unmatched", started_at),
+        "mode": profiler.mode,
+        "endpoint": request.endpoint,
+        "route": request.url_rule.rule if request.url_rule else None,
+        "method": request.method,
+        "path": request.path,
+        "arguments": request_argument_sizes(),
+        "started_at": started_at,
+    }, time.perf_counter())
+
+
+@app.after_request
+def stop_request_profile(response):
+    active = g.pop("request_profile", None)
+    if active is None:
+        return response
+    response.headers["X-Profile-Name"] = active[1]["name"]
+    # stop once the body is sent, so streamed responses are profiled to the end
+    response.call_on_close(lambda: finish_request_profile(active, response.status_code))
+    return response
+
+
+@app.teardown_request
+def abort_request_profile(error=None):
+    # after_request does not run when a view raises
+    active = g.pop("request_profile", None)
+    if active is not None:
+        finish_request_profile(active, 500, error)
 
 
 # === Helpers ===
 
 def get_graph_headers():
-    cache = load_cache()
-    msal_app = PublicClientApplication(
-        client_id=CLIENT_ID,
-        authority=AUTHORITY,
-        token_cache=cache,
-    )
-    access_token = get_token(msal_app)
-    return {"Authorization": f"Bearer {access_token}"}
+    with track_dependency("graph_token"):
+        return TOKEN_PROVIDER.get_headers()
 
 
-def search_onedrive_docx(query: str):
-    if not query:
-        return []
-    headers = get_graph_headers()
-    url = (
-        "https://graph.microsoft.com/v1.0/me/drive/root/"
-        f"search(q='{query}')"
-        "?$filter=endswith(name,'.docx')"
-        "&$select=name,id,webUrl"
-    )
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    data = response.json()
+# retries, Retry-After handling and adaptive concurrency for every Graph call
+GRAPH = GraphClient(get_graph_headers)
+
+
+def search_onedrive_docx(query: str, top: int = GRAPH_PAGE_SIZE, cursor: str = None):
+    """
+    Return one page of Graph search results plus a cursor for the next page
+    (None on the last page). Pass the cursor back to continue the search.
+    """
+    if not query and not cursor:
+        return {"results": [], "next_cursor": None}
+    if cursor:
+        url = GRAPH.decode_cursor(cursor)
+    else:
+        escaped = query.replace("'", "''")
+        url = (
+            "/me/drive/root/"
+            f"search(q='{escaped}')"
+            "?$filter=endswith(name,'.docx')"
+            "&$select=name,id,webUrl"
+            f"&$top={top}"
+        )
+    with track_dependency("graph_search"):
+        data = next(GRAPH.iter_pages(url))
 
-    os.makedirs("output", exist_ok=True)
-    with open("output/query_result.json", "w") as f:
-        json.dump(data, f, indent=4)
+    if SEARCH_DEBUG_DUMP:
+        os.makedirs("output", exist_ok=True)
+        with open("output/query_result.json", "w") as f:
+            json.dump(data, f, indent=4)
 
     items = data.get("value", [])
-    return [
+    results = [
         {
             "id": item.get("id"),
             "title": item.get("name", "(no name)"),
@@ -179,48 +436,354 @@ def search_onedrive_docx(query: str):
         }
         for item in items
     ]
+    return {"results": results, "next_cursor": GRAPH.encode_cursor(data.get("@odata.nextLink"))}
 
 
 def load_notes_metadata():
-    if not os.path.exists(NOTES_METADATA_PATH):
-        return []
-    with open(NOTES_METADATA_PATH, "r") as f:
-        return json.load(f)
+    return NOTES_CATALOG.all()
 
 
 def save_notes_metadata(notes):
-    with open(NOTES_METADATA_PATH, "w") as f:
-        json.dump(notes, f, indent=2)
+    NOTES_CATALOG.replace_all(notes)
+    SEARCH_CACHE.clear()
 
 
 def append_note_metadata_if_missing(note_id: str, name: str = "", web_url: str = ""):
-    notes = load_notes_metadata()
-    if any(n.get("id") == note_id for n in notes):
+    NOTES_CATALOG.add_if_missing({"id": note_id, "name": name, "webUrl": web_url})
+
+
+def notes_sources_signature():
+    """
+    Changes whenever the files the local index is built from change on disk,
+    including from another process (download_all_notes.py).
+    """
+    try:
+        st = os.stat(NOTE_FILES_MANIFEST_PATH)
+        manifest = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        manifest = None
+    return NOTES_CATALOG.version, manifest
+
+
+def rebuild_notes_index():
+    with NOTES_INDEX_LOCK:
+        NOTES_INDEX_SOURCES[0] = notes_sources_signature()
+        notes = load_notes_metadata()
+        SUGGEST_INDEX.set_notes(notes)
+        # only notes whose file, cached text, name or link changed are re-read
+        versions = {}
+        for note in notes:
+            version = local_document_version(note, NOTE_FILES_DIR, TEXT_CACHE)
+            if version is not None:
+                versions[note["id"]] = version
+        changed = [
+            note for note in notes
+            if note["id"] in versions and INDEXED_VERSIONS.get(note["id"]) != versions[note["id"]]
+        ]
+        removed = set(INDEXED_VERSIONS) - set(versions)
+        if NOTES_INDEX.ready and not changed and not removed:
+            return
+        documents = list(iter_local_documents(changed, NOTE_FILES_DIR, TEXT_CACHE))
+        stale = removed | {note["id"] for note in changed}
+        NOTES_INDEX.update(documents, stale)
+        CHUNK_STORE.update(documents, stale)
+        for note_id in stale:
+            INDEXED_VERSIONS.pop(note_id, None)
+        for note, _ in documents:
+            INDEXED_VERSIONS[note["id"]] = versions[note["id"]]
+        SEARCH_CACHE.clear()
+        SUGGEST_INDEX.set_terms(NOTES_INDEX.frequent_terms(SUGGEST_MAX_TERMS))
+
+
+def rebuild_notes_index_in_background():
+    threading.Thread(target=rebuild_notes_index, daemon=True).start()
+
+
+def refresh_notes_index_if_stale():
+    """
+    Drop cached searches and rebuild the index in the background when the
+    catalog or note_files/ changed since the last rebuild. Changes made
+    while a rebuild runs are picked up by a later call.
+    """
+    signature = notes_sources_signature()
+    if NOTES_INDEX_LOCK.locked() or signature == NOTES_INDEX_SOURCES[0]:
         return
-    notes.append({"id": note_id, "name": name, "webUrl": web_url})
-    save_notes_metadata(notes)
+    NOTES_INDEX_SOURCES[0] = signature  # so concurrent callers start only one rebuild
+    SEARCH_CACHE.clear()
+    rebuild_notes_index_in_background()
 
 
-def retrieve_document_content(item_id: str) -> bytes:
-    headers = get_graph_headers()
-    url = (
-        f"https://graph.microsoft.com/v1.0/drives/"
-        f"{ONEDRIVE_DOCUMENTS_FOLDER_ID}/items/{item_id}/content"
-    )
-    response = requests.get(url, headers=headers)
-    if response.status_code != 200:
-        raise RuntimeError(
-            f"Failed to retrieve document content from {url}: "
-            f"{response.status_code} {response.text}"
+LOCAL_CURSOR_PREFIX = "local:"  # cursors into local index results; Graph cursors are base64
+UNINDEXED_CURSOR_PREFIX = "unindexed:"  # Graph results limited to notes missing from the index
+
+
+def decode_local_cursor(cursor: str) -> int:
+    try:
+        offset = int(cursor[len(LOCAL_CURSOR_PREFIX):])
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+def search_unindexed_notes(query: str, top: int, graph_cursor: str = None):
+    """
+    One page of Graph results for `query`, keeping only notes the local
+    index does not cover (no local file or cached text yet, e.g. added by
+    /api/reload-notes). Paged with "unindexed:<graph cursor>" cursors.
+    """
+    page = search_onedrive_docx(query, top=top, cursor=graph_cursor)
+    next_cursor = UNINDEXED_CURSOR_PREFIX + page["next_cursor"] if page["next_cursor"] else None
+    return {"results": [r for r in page["results"] if not NOTES_INDEX.covers(r["id"])], "next_cursor": next_cursor}
+
+
+def search_notes(query: str, top: int = GRAPH_PAGE_SIZE, cursor: str = None):
+    """
+    Answer from SEARCH_CACHE when this (normalized) query was seen recently.
+    Otherwise search the local index first, `top` hits per page with a
+    "local:<offset>" cursor for the next one; only go to Graph when the index
+    is not built yet or has nothing for this query. When some notes are not
+    indexed, the last local page gets an "unindexed:" cursor that pages on
+    through Graph's hits among those notes. Graph cursors go straight to
+    Graph.
+    """
+    refresh_notes_index_if_stale()
+    cache_key = SEARCH_CACHE.key(query, top, cursor)
+    cached = SEARCH_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = SEARCH_CACHE.generation
+
+    if cursor and cursor.startswith(UNINDEXED_CURSOR_PREFIX):
+        result = search_unindexed_notes(query, top, cursor[len(UNINDEXED_CURSOR_PREFIX):] or None)
+        SEARCH_CACHE.put(cache_key, result, generation)
+        return result
+
+    result = None
+    local_cursor = cursor is not None and cursor.startswith(LOCAL_CURSOR_PREFIX)
+    if local_cursor or not cursor:
+        offset = decode_local_cursor(cursor) if local_cursor else 0
+        if local_cursor and not NOTES_INDEX.ready:
+            raise ValueError("Invalid cursor")
+        # one extra hit tells whether there is a next page
+        results = NOTES_INDEX.search(query, limit=top + 1, offset=offset) if NOTES_INDEX.ready else []
+        if results or local_cursor:
+            next_cursor = f"{LOCAL_CURSOR_PREFIX}{offset + top}" if len(results) > top else None
+            if next_cursor is None and len(NOTES_CATALOG) > len(NOTES_INDEX):
+                # Graph is only asked about the rest when the client pages on
+                next_cursor = UNINDEXED_CURSOR_PREFIX
+            result = {"results": results[:top], "next_cursor": next_cursor}
+    if result is None:
+        result = search_onedrive_docx(query, top=top, cursor=cursor)
+    SEARCH_CACHE.put(cache_key, result, generation)
+    return result
+
+
+# Document retrieval runs as coroutines on the shared event loop (async_io),
+# over one pooled HTTP client; the plain functions are blocking wrappers.
+
+async def aget_document_version(item_id: str) -> str:
+    """
+    Return the content tag (cTag, falling back to eTag) of a drive item.
+    This is a small metadata call, much cheaper than downloading the file.
+    """
+    with track_dependency("graph_metadata"):
+        data = await GRAPH.aget_json(
+            f"/drives/{ONEDRIVE_DOCUMENTS_FOLDER_ID}/items/{item_id}?$select=id,eTag,cTag"
         )
+    return data.get("cTag") or data.get("eTag") or ""
+
+
+async def adownload_document_content(item_id: str) -> bytes:
+    url = f"/drives/{ONEDRIVE_DOCUMENTS_FOLDER_ID}/items/{item_id}/content"
+    with track_dependency("graph_download"):
+        response = await GRAPH.arequest("GET", url)
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Failed to retrieve document content from {url}: "
+                f"{response.status_code} {response.text}"
+            )
+    count_payload_bytes("note_download", len(response.content))
     return response.content
 
 
-def serialize_thread(doc):
+async def aretrieve_document_content(item_id: str, version: str = None) -> bytes:
+    """
+    Read-through DOCUMENT_CACHE: only download when this version of the
+    note is not cached yet.
+    """
+    if version is None:
+        version = await aget_document_version(item_id)
+    cached = await asyncio.to_thread(DOCUMENT_CACHE.get, item_id, version)
+    if cached is not None:
+        return cached
+    content = await adownload_document_content(item_id)
+    await asyncio.to_thread(DOCUMENT_CACHE.put, item_id, version, content)
+    return content
+
+
+async def aretrieve_document_text(item_id: str, version: str = None) -> str:
+    """
+    Extracted text of a note, read through TEXT_CACHE so each version of a
+    note is only downloaded and parsed once.
+    """
+    if version is None:
+        version = await aget_document_version(item_id)
+    cached = await asyncio.to_thread(TEXT_CACHE.get, item_id, version)
+    if cached is not None:
+        return cached.decode("utf-8")
+    content = await aretrieve_document_content(item_id, version)
+    with track_dependency("docx_extract"):
+        text = await asyncio.to_thread(extract_docx_text, content)
+    await asyncio.to_thread(TEXT_CACHE.put, item_id, version, text.encode("utf-8"))
+    return text
+
+
+class AttachmentFetchError(RuntimeError):
+    def __init__(self, errors):
+        self.errors = errors  # item id -> error message
+        details = "; ".join(f"{item_id}: {msg}" for item_id, msg in errors.items())
+        super().__init__(f"Failed to retrieve {len(errors)} document(s): {details}")
+
+
+async def afetch_documents_concurrently(fetch, item_ids) -> list:
+    """
+    Await `fetch(item_id)` for several documents concurrently (at most
+    ATTACHMENT_FETCH_WORKERS at a time), returning the results in the same
+    order as `item_ids`. Stops at the first failure and raises
+    AttachmentFetchError listing every document that failed by then
+    (GraphAuthError as is: no document can be fetched without a token).
+    """
+    if not item_ids:
+        return []
+    semaphore = asyncio.Semaphore(ATTACHMENT_FETCH_WORKERS)
+
+    async def bounded(item_id):
+        async with semaphore:
+            return await fetch(item_id)
+
+    tasks = [asyncio.ensure_future(bounded(i)) for i in item_ids]
+    await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+
+    failed = {
+        item_id: t.exception()
+        for item_id, t in zip(item_ids, tasks)
+        if t.done() and not t.cancelled() and t.exception() is not None
+    }
+    if failed:
+        for t in tasks:
+            t.cancel()
+        for error in failed.values():
+            if isinstance(error, GraphAuthError):
+                raise error
+        raise AttachmentFetchError({item_id: str(error) for item_id, error in failed.items()})
+    return [t.result() for t in tasks]
+
+
+def retrieve_document_versions(item_ids) -> dict:
+    versions = async_io.run(afetch_documents_concurrently(aget_document_version, item_ids))
+    return dict(zip(item_ids, versions))
+
+
+def retrieve_documents_content(item_ids, versions=None) -> list:
+    versions = versions or {}
+    return async_io.run(afetch_documents_concurrently(
+        lambda item_id: aretrieve_document_content(item_id, versions.get(item_id)), item_ids
+    ))
+
+
+def retrieve_documents_text(item_ids, versions=None) -> list:
+    versions = versions or {}
+    return async_io.run(afetch_documents_concurrently(
+        lambda item_id: aretrieve_document_text(item_id, versions.get(item_id)), item_ids
+    ))
+
+
+def note_label(item_id) -> str:
+    note = NOTES_CATALOG.get(item_id) or {}
+    return note.get("name") or item_id
+
+
+def build_attachment_blocks(item_ids, mode: str = None, versions=None) -> list:
+    """
+    (label, block) pairs for the attached notes: their extracted text in
+    "text" mode, or the base64-encoded .docx files in "file" mode. Pass
+    `versions` (item id -> cTag/eTag) when already known to skip the
+    metadata lookups.
+    """
+    if not item_ids:
+        return []
+    mode = mode or ATTACHMENT_MODE
+    if mode == "file":
+        blocks = []
+        for item_id, content_bytes in zip(item_ids, retrieve_documents_content(item_ids, versions)):
+            with track_dependency("base64_encode"):
+                encoded = base64.b64encode(content_bytes).decode("utf-8")
+            count_payload_bytes("base64_output", len(encoded))
+            blocks.append((note_label(item_id), {"type": "file_url", "file_url": {"url": encoded}}))
+        return blocks
+
+    blocks = []
+    for item_id, text in zip(item_ids, retrieve_documents_text(item_ids, versions)):
+        name = note_label(item_id)
+        blocks.append((name, {"type": "text", "text": f"Document: {name}\n\n{text}"}))
+    return blocks
+
+
+def build_passage_blocks(query: str, note_ids) -> list:
+    """
+    (label, block) pairs for the top passages for `query`, best first, from
+    the attached notes when there are any (topped up with their leading
+    passages, so an attached note is never left out), otherwise from every
+    locally indexed note.
+    """
+    if note_ids:
+        texts = retrieve_documents_text(note_ids)
+        documents = [
+            (NOTES_CATALOG.get(item_id) or {"id": item_id, "name": item_id}, text)
+            for item_id, text in zip(note_ids, texts)
+        ]
+        passages = CHUNK_STORE.rank_documents(query, documents, CHAT_TOP_K_PASSAGES)
+    else:
+        passages = CHUNK_STORE.search(query, CHAT_TOP_K_PASSAGES)
+
+    return [
+        (
+            f"{passage['note_name']} (passage {i})",
+            {"type": "text", "text": f"Passage [{i}] from my note \"{passage['note_name']}\":\n{passage['text']}"},
+        )
+        for i, passage in enumerate(passages, start=1)
+    ]
+
+
+def request_token_budget(payload) -> int:
+    try:
+        requested = int(payload.get("token_budget") or LLM_CONTEXT_TOKEN_BUDGET)
+    except (TypeError, ValueError):
+        requested = LLM_CONTEXT_TOKEN_BUDGET
+    return max(1, min(requested, LLM_CONTEXT_TOKEN_BUDGET))
+
+
+def pack_message_content(question: str, labeled_blocks, budget: int, split_evenly: bool = False):
+    """
+    The question first, then the (label, block) pairs in the order given
+    (most relevant first), cut down to `budget` estimated tokens; with
+    split_evenly every block gets an equal share instead. Files are limited
+    to LLM_FILE_ATTACHMENT_BUDGET_BYTES. Returns (content, report).
+    """
+    items = [{"block": {"type": "text", "text": question}, "label": "question", "required": True}]
+    items += [{"block": block, "label": label} for label, block in labeled_blocks]
+    return pack_context(items, budget, split_evenly, LLM_FILE_ATTACHMENT_BUDGET_BYTES)
+
+
+def serialize_thread(doc, conversations=None, next_cursor=None):
     return {
         "id": str(doc["_id"]),
         "title": doc.get("title", "Untitled"),
-        "conversations": doc.get("conversations", []),
+        "conversations": conversations or [],
+        "message_count": doc.get("message_count", 0),
+        "next_cursor": next_cursor,
         "created_at": doc.get("created_at"),
         "updated_at": doc.get("updated_at"),
     }
@@ -249,12 +812,40 @@ def page3():
 @app.route("/api/search")
 def api_search():
     q = request.args.get("q", "")
+    cursor = request.args.get("cursor") or None
+    top = min(max(request.args.get("top", GRAPH_PAGE_SIZE, type=int), 1), 200)
     try:
-        return jsonify(search_onedrive_docx(q))
+        return jsonify(search_notes(q, top=top, cursor=cursor))
+    except GraphAuthError as e:
+        return jsonify({"error": str(e)}), 401
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/suggest")
+def api_suggest():
+    """
+    Typeahead for the search box, served from memory only (no Graph calls):
+    {"suggestions": [{"kind": "note" | "term", "text", ...}]}.
+    """
+    prefix = request.args.get("prefix", "")
+    limit = min(max(request.args.get("limit", 8, type=int), 1), 20)
+    refresh_notes_index_if_stale()
+    return jsonify({"suggestions": SUGGEST_INDEX.suggest(prefix, limit)})
+
+
+@app.route("/api/search/stats")
+def api_search_stats():
+    return jsonify(SEARCH_CACHE.stats())
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(METRICS.render(), content_type=metrics.CONTENT_TYPE)
+
+
 @app.route("/api/notes-metadata")
 def api_notes_metadata():
     return jsonify(load_notes_metadata())
@@ -263,44 +854,38 @@ def api_notes_metadata():
 @app.route("/api/reload-notes", methods=["POST"])
 def api_reload_notes():
     """
-    Refresh notes_metadata.json by searching OneDrive for 'notes' *.docx files.
+    Refresh notes_metadata.json incrementally with the Graph drive delta API.
     """
     try:
-        cache = load_cache()
-        msal_app = PublicClientApplication(
-            client_id=CLIENT_ID,
-            authority=AUTHORITY,
-            token_cache=cache,
-        )
-        access_token = get_token(msal_app)
+        access_token = TOKEN_PROVIDER.get_access_token(interactive=False)
         if not access_token:
             return jsonify({"error": "No Microsoft Graph access token. Please authorize on Page 1 first."}), 401
 
-        headers = {"Authorization": f"Bearer {access_token}"}
-
-        url = (
-            "https://graph.microsoft.com/v1.0/me/drive/root/"
-            "search(q='notes')"
-            "?$filter=endswith(name,'.docx')"
-            "&$select=name,id,webUrl"
+        list_of_notes, changes = sync_notes_metadata(
+            GRAPH, NOTES_CATALOG, NOTES_DELTA_STATE_PATH
         )
 
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        list_of_notes = data.get("value", [])
-
-        # write list of notes to json file
-        with open(NOTES_METADATA_PATH, "w") as f:
-            json.dump(list_of_notes, f, indent=2)
+        if any(changes.values()):
+            SEARCH_CACHE.clear()
+            SUGGEST_INDEX.set_notes(list_of_notes)
+            rebuild_notes_index_in_background()
 
         return jsonify(
             {
                 "status": "ok",
                 "count": len(list_of_notes),
-                "message": f"Reloaded notes metadata with {len(list_of_notes)} items.",
+                "added": changes["added"],
+                "updated": changes["updated"],
+                "removed": changes["removed"],
+                "message": (
+                    f"Reloaded notes metadata with {len(list_of_notes)} items "
+                    f"({len(changes['added'])} added, {len(changes['updated'])} updated, "
+                    f"{len(changes['removed'])} removed)."
+                ),
             }
         )
+    except GraphAuthError as e:
+        return jsonify({"error": str(e)}), 401
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -313,113 +898,273 @@ def api_summarize():
         return jsonify({"error": "No ids provided"}), 400
 
     try:
-        file_contents = []
-        for item_id in ids:
-            content_bytes = retrieve_document_content(item_id)
-            encoded = base64.b64encode(content_bytes).decode("utf-8")
-            file_contents.append(encoded)
-
-        prompt = (
-            "You are summarizing a set of Microsoft Word documents from my notes. "
-            "For each attached document, provide a short summary, then a brief overall summary."
-        )
+        mode = payload.get("attachment_mode") or ATTACHMENT_MODE
+        budget = request_token_budget(payload)
+        versions = retrieve_document_versions(ids)
+        cache_key = summary_cache_key(versions, SUMMARIZE_PROMPT, SUMMARIZE_MODEL, mode, budget)
+        cached = SUMMARY_CACHE.get(cache_key)
+        if cached is not None:
+            return jsonify({"summary": cached, "source": "cache"})
 
-        content = [{"type": "text", "text": prompt}]
-        for encoded_data in file_contents:
-            content.append(
-                {"type": "file_url", "file_url": {"url": encoded_data}}
-            )
+        attachments = build_attachment_blocks(ids, mode, versions)
+        # one summary per note, so every note gets its share of the budget
+        content, context_report = pack_message_content(SUMMARIZE_PROMPT, attachments, budget, split_evenly=True)
 
-        response = PPLX_CLIENT.chat.completions.create(
-            model="sonar",
-            messages=[{"role": "user", "content": content}],
-        )
+        response = complete_chat(SUMMARIZE_MODEL, [{"role": "user", "content": content}])
 
         summary_text = response.choices[0].message.content
-        return jsonify({"summary": summary_text, "source": "cloud"})
+        count_payload_bytes("llm_response", len(summary_text or ""))
+        SUMMARY_CACHE.put(cache_key, summary_text)
+        return jsonify({"summary": summary_text, "source": "cloud", "context": context_report})
+    except GraphAuthError as e:
+        return jsonify({"error": str(e)}), 401
+    except AttachmentFetchError as e:
+        return jsonify({"error": str(e), "errors": e.errors}), 502
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/chat", methods=["POST"])
-def api_chat():
+# === Thread history for chat ===
+
+def build_history_messages(thread_id, budget: int):
+    """
+    Chat messages carrying the thread so far: a system message with the
+    summary of older turns, then the turns after it verbatim (newest kept
+    first when they do not all fit in `budget` tokens). Returns
+    (messages, report).
+    """
+    report = {"history_turns": 0, "history_summary": False, "history_tokens": 0}
+    if THREAD_STORE is None or not thread_id:
+        return [], report
+    try:
+        with track_dependency("mongo_read"):
+            doc = THREAD_STORE.get(thread_id)
+            if doc is None:
+                return [], report
+            summary_seq = doc.get("summary_seq", 0)
+            # turns the summary does not cover yet; capped in case refreshes lag behind
+            limit = CHAT_HISTORY_TURNS + CHAT_HISTORY_SUMMARY_BATCH
+            turns = [
+                turn for turn in THREAD_STORE.messages_page(thread_id, None, limit)[0]
+                if turn["seq"] > summary_seq
+            ]
+    except Exception:
+        return [], report
+
+    remaining = budget
+    system = []
+    summary = doc.get("history_summary")
+    if summary:
+        text = truncate_to_tokens(f"Summary of our earlier conversation:\n{summary}", budget // 2)
+        system = [{"role": "system", "content": text}]
+        remaining -= estimate_tokens(text)
+        report["history_summary"] = True
+
+    kept = []
+    for turn in reversed(turns):
+        pair = [
+            {"role": "user", "content": turn.get("user") or ""},
+            {"role": "assistant", "content": turn.get("assistant") or ""},
+        ]
+        tokens = sum(estimate_tokens(m["content"]) for m in pair)
+        if tokens > remaining:
+            break
+        kept = pair + kept
+        remaining -= tokens
+
+    report["history_turns"] = len(kept) // 2
+    report["history_tokens"] = budget - remaining
+    return system + kept, report
+
+
+async def arefresh_history_summary(thread_id):
+    """
+    Fold the turns that dropped out of the verbatim window into the thread's
+    running summary with one LLM call. Runs in the background after a turn
+    is saved; does nothing until CHAT_HISTORY_SUMMARY_BATCH turns are due.
+    """
+    doc = await asyncio.to_thread(THREAD_STORE.get, thread_id)
+    if doc is None:
+        return
+    summary_seq = doc.get("summary_seq", 0)
+    upto_seq = doc.get("message_count", 0) - CHAT_HISTORY_TURNS
+    if upto_seq - summary_seq < CHAT_HISTORY_SUMMARY_BATCH:
+        return
+
+    turns = await asyncio.to_thread(THREAD_STORE.turns_between, thread_id, summary_seq, upto_seq)
+    lines = [f"Current summary:\n{doc.get('history_summary') or '(none yet)'}", "New turns:"]
+    for turn in turns:
+        lines.append("Me: " + truncate_to_tokens(turn.get("user") or "", HISTORY_SUMMARY_MESSAGE_TOKENS))
+        lines.append("Assistant: " + truncate_to_tokens(turn.get("assistant") or "", HISTORY_SUMMARY_MESSAGE_TOKENS))
+
+    with track_dependency("perplexity_history_summary"):
+        response = await PPLX_CLIENT.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=[
+                {"role": "system", "content": HISTORY_SUMMARY_PROMPT},
+                {"role": "user", "content": "\n\n".join(lines)},
+            ],
+        )
+    summary = response.choices[0].message.content
+    await asyncio.to_thread(THREAD_STORE.set_history_summary, thread_id, summary, upto_seq, summary_seq)
+
+
+HISTORY_REFRESHING = set()  # thread ids with a refresh running; only touched on the async_io loop
+
+
+async def arefresh_history_summary_once(thread_id):
+    if thread_id in HISTORY_REFRESHING:
+        return
+    HISTORY_REFRESHING.add(thread_id)
+    try:
+        await arefresh_history_summary(thread_id)
+    except Exception as e:
+        print(f"Refreshing the history summary of thread {thread_id} failed: {e}")
+    finally:
+        HISTORY_REFRESHING.discard(thread_id)
+
+
+def save_chat_turn(thread_id, user_text, reply, citations):
+    if THREAD_STORE is None or not thread_id:
+        return
+    try:
+        with track_dependency("mongo_write"):
+            THREAD_STORE.append_message(thread_id, user_text, reply, citations)
+    except Exception:
+        return
+    async_io.spawn(arefresh_history_summary_once(thread_id))
+
+
+def parse_chat_request():
+    """
+    Shared request handling for /api/chat and /api/chat/stream. Returns
+    (chat, None) with the messages (thread history + this message and its
+    note content) ready for the LLM, or
+    (None, error_response) when the request cannot be served.
+    """
     data = request.get_json(silent=True) or {}
     user_text = (data.get("message") or "").strip()
     note_ids = data.get("note_ids") or []
-    thread_id = data.get("thread_id")
 
     if not user_text:
-        return jsonify({"error": "Empty message"}), 400
-
-    content = [{"type": "text", "text": user_text}]
-    file_contents = []
+        return None, (jsonify({"error": "Empty message"}), 400)
 
+    mode = data.get("attachment_mode") or CHAT_ATTACHMENT_MODE
     try:
-        for note_id in note_ids:
-            content_bytes = retrieve_document_content(note_id)
-            encoded = base64.b64encode(content_bytes).decode("utf-8")
-            file_contents.append(encoded)
-
-        for encoded_data in file_contents:
-            content.append(
-                {"type": "file_url", "file_url": {"url": encoded_data}}
-            )
+        if mode == "passages":
+            attachments = build_passage_blocks(user_text, note_ids)
+        else:
+            attachments = build_attachment_blocks(note_ids, mode)
+    except GraphAuthError as e:
+        return None, (jsonify({"error": str(e)}), 401)
+    except AttachmentFetchError as e:
+        return None, (jsonify({"error": f"Failed to load attachments: {e}", "errors": e.errors}), 502)
     except Exception as e:
-        return jsonify({"error": f"Failed to load attachments: {e}"}), 500
+        return None, (jsonify({"error": f"Failed to load attachments: {e}"}), 500)
+
+    budget = request_token_budget(data)
+    thread_id = data.get("thread_id")
+    history, history_report = build_history_messages(thread_id, int(budget * CHAT_HISTORY_BUDGET_SHARE))
+    content, context_report = pack_message_content(
+        user_text, attachments, max(1, budget - history_report["history_tokens"])
+    )
+    context_report.update(history_report, budget=budget)
+    context_report["used_tokens"] += history_report["history_tokens"]
+    chat = {
+        "user_text": user_text,
+        "thread_id": thread_id,
+        "messages": history + [{"role": "user", "content": content}],
+        "context": context_report,
+    }
+    return chat, None
+
+
+@app.route("/api/chat", methods=["POST"])
+def api_chat():
+    chat, error = parse_chat_request()
+    if error:
+        return error
 
     try:
-        response = PPLX_CLIENT.chat.completions.create(
-            model="sonar",
-            messages=[{"role": "user", "content": content}],
-        )
+        response = complete_chat(CHAT_MODEL, chat["messages"])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
     reply = response.choices[0].message.content
+    count_payload_bytes("llm_response", len(reply or ""))
     citations = getattr(response, "citations", []) or []
 
-    if threads_collection and thread_id:
-        try:
-            threads_collection.update_one(
-                {"_id": ObjectId(thread_id)},
-                {
-                    "$push": {
-                        "conversations": {
-                            "user": user_text,
-                            "assistant": reply,
-                            "citations": citations,
-                        }
-                    },
-                    "$set": {"updated_at": datetime.utcnow()},
-                },
-            )
-        except Exception:
-            pass
+    save_chat_turn(chat["thread_id"], chat["user_text"], reply, citations)
+
+    return jsonify({"reply": reply, "citations": citations, "context": chat["context"]})
+
 
-    return jsonify({"reply": reply, "citations": citations})
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def api_chat_stream():
+    """
+    Same request as /api/chat, but the reply is streamed back as
+    Server-Sent Events: "token" events while the model generates, then one
+    "citations" event and a final "done" (or "error") event.
+    """
+    chat, error = parse_chat_request()
+    if error:
+        return error
+
+    def generate():
+        parts = []
+        citations = []
+        try:
+            stream = complete_chat(CHAT_MODEL, chat["messages"], stream=True)
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        try:
+            # includes the time the client takes to read each token
+            with track_dependency("perplexity_stream"):
+                for chunk in async_io.iter_async(stream):
+                    if chunk.citations:
+                        citations = chunk.citations
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if isinstance(delta, str) and delta:
+                        parts.append(delta)
+                        yield sse_event("token", {"text": delta})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        finally:
+            # also when the browser disconnects mid-reply (GeneratorExit), so the
+            # upstream response goes back to the shared connection pool
+            async_io.run(stream.close())
+
+        reply = "".join(parts)
+        count_payload_bytes("llm_response", len(reply))
+        yield sse_event("citations", {"citations": citations})
+        save_chat_turn(chat["thread_id"], chat["user_text"], reply, citations)
+        yield sse_event("done", {"reply": reply, "context": chat["context"]})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/api/auth-status")
 def api_auth_status():
     try:
-        cache = load_cache()
-        msal_app = PublicClientApplication(
-            client_id=CLIENT_ID,
-            authority=AUTHORITY,
-            token_cache=cache,
-        )
-        accounts = msal_app.get_accounts()
-        if accounts:
-            result = msal_app.acquire_token_silent(SCOPES, account=accounts[0])
-            if result and "access_token" in result:
-                return jsonify(
-                    {
-                        "status": "ok",
-                        "message": "Microsoft Graph permissions are properly set.",
-                    }
-                )
-
-        flow = msal_app.initiate_device_flow(scopes=SCOPES)
+        if TOKEN_PROVIDER.get_access_token(interactive=False):
+            return jsonify(
+                {
+                    "status": "ok",
+                    "message": "Microsoft Graph permissions are properly set.",
+                }
+            )
+
+        flow = TOKEN_PROVIDER.start_device_flow()
         if "user_code" not in flow:
             return jsonify(
                 {
@@ -447,15 +1192,22 @@ def api_usage_password():
     return jsonify({"ok": False}), 401
 
 
-# === Threads APIs (unchanged from your current version) ===
+# === Threads APIs ===
 
 @app.route("/api/threads", methods=["GET"])
 def api_threads_list():
-    if not threads_collection:
-        return jsonify([])
-    docs = list(
-        threads_collection.find({}, {"conversations": 0}).sort("updated_at", -1)
-    )
+    """
+    Threads for the sidebar, most recently updated first, THREADS_PAGE_SIZE
+    at a time. Pass the returned next_cursor as ?cursor= for the next page.
+    """
+    if THREAD_STORE is None:
+        return jsonify({"threads": [], "next_cursor": None})
+    try:
+        limit = request.args.get("limit", default=THREADS_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, 200))
+        docs, next_cursor = THREAD_STORE.list_page(request.args.get("cursor"), limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     threads = [
         {
             "id": str(doc["_id"]),
@@ -464,79 +1216,136 @@ def api_threads_list():
         }
         for doc in docs
     ]
-    return jsonify(threads)
+    return jsonify({"threads": threads, "next_cursor": next_cursor})
 
 
 @app.route("/api/threads", methods=["POST"])
 def api_threads_create():
-    if not threads_collection:
+    if THREAD_STORE is None:
         return jsonify({"error": "Threads storage not configured"}), 500
 
     payload = request.get_json(silent=True) or {}
     title = (payload.get("title") or "").strip() or "New thread"
-    now = datetime.utcnow()
-    doc = {
-        "title": title,
-        "conversations": [],
-        "created_at": now,
-        "updated_at": now,
-    }
-    result = threads_collection.insert_one(doc)
-    doc["_id"] = result.inserted_id
+    doc = THREAD_STORE.create(title)
     return jsonify(serialize_thread(doc)), 201
 
 
 @app.route("/api/threads/<thread_id>", methods=["GET"])
 def api_threads_get(thread_id):
-    if not threads_collection:
+    """
+    Thread metadata plus its latest THREAD_PAGE_SIZE turns (oldest first).
+    Pass the returned next_cursor as ?before= to get the page before it;
+    next_cursor is null once the start of the thread is reached.
+    """
+    if THREAD_STORE is None:
         return jsonify({"error": "Threads storage not configured"}), 500
     try:
-        doc = threads_collection.find_one({"_id": ObjectId(thread_id)})
+        before = request.args.get("before", type=int)
+        limit = request.args.get("limit", default=THREAD_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, 200))
+        doc = THREAD_STORE.get(thread_id)
+        if not doc:
+            return jsonify({"error": "Thread not found"}), 404
+        conversations, next_cursor = THREAD_STORE.messages_page(thread_id, before, limit)
     except Exception:
         return jsonify({"error": "Invalid thread id"}), 400
-    if not doc:
-        return jsonify({"error": "Thread not found"}), 404
-    return jsonify(serialize_thread(doc))
+    return jsonify(serialize_thread(doc, conversations, next_cursor))
 
 
 @app.route("/api/threads/<thread_id>", methods=["PUT"])
 def api_threads_rename(thread_id):
-    if not threads_collection:
+    if THREAD_STORE is None:
         return jsonify({"error": "Threads storage not configured"}), 500
     payload = request.get_json(silent=True) or {}
     new_title = (payload.get("title") or "").strip()
     if not new_title:
         return jsonify({"error": "Title cannot be empty"}), 400
     try:
-        result = threads_collection.update_one(
-            {"_id": ObjectId(thread_id)},
-            {"$set": {"title": new_title, "updated_at": datetime.now(datetime.UTC)}},
-        )
+        renamed = THREAD_STORE.rename(thread_id, new_title)
     except Exception:
         return jsonify({"error": "Invalid thread id"}), 400
-    if result.matched_count == 0:
+    if not renamed:
         return jsonify({"error": "Thread not found"}), 404
     return jsonify({"status": "ok"})
 
 
 @app.route("/api/threads/<thread_id>", methods=["DELETE"])
 def api_threads_delete(thread_id):
-    if not threads_collection:
+    if THREAD_STORE is None:
         return jsonify({"error": "Threads storage not configured"}), 500
     try:
-        result = threads_collection.delete_one({"_id": ObjectId(thread_id)})
+        deleted = THREAD_STORE.delete(thread_id)
     except Exception:
         return jsonify({"error": "Invalid thread id"}), 400
-    if result.deleted_count == 0:
+    if not deleted:
         return jsonify({"error": "Thread not found"}), 404
     return jsonify({"status": "deleted"})
 
 
+# === Profiling admin APIs ===
+
+def profiles_admin_error():
+    if not PROFILE_SECRET:
+        return jsonify({"error": "Profiling admin is not configured (set PROFILE_SECRET)"}), 404
+    if not hmac.compare_digest(request.headers.get("X-Profile-Admin") or "", PROFILE_SECRET):
+        return jsonify({"error": "Forbidden"}), 403
+    return None
+
+
+@app.route("/api/admin/profiles")
+def api_admin_profiles_list():
+    """Saved request profiles, newest first (metadata only). Needs X-Profile-Admin: <PROFILE_SECRET>."""
+    error = profiles_admin_error()
+    if error:
+        return error
+    return jsonify({"profiles": PROFILE_STORE.list()})
+
+
+@app.route("/api/admin/profiles/<name>")
+def api_admin_profiles_get(name):
+    """
+    Download one saved profile as JSON, or with ?format=folded the sampled
+    stacks in collapsed-stack format (one "stack count" line each, as read by
+    flamegraph tools).
+    """
+    error = profiles_admin_error()
+    if error:
+        return error
+    path = PROFILE_STORE.path(name)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get("format") != "folded":
+        return send_file(path, mimetype="application/json", as_attachment=True, download_name=name)
+
+    with open(path, "r") as f:
+        stacks = json.load(f)["profile"].get("stacks")
+    if stacks is None:
+        return jsonify({"error": "Only sampling profiles have stacks"}), 400
+    folded = "".join(f"{stack} {count}\n" for stack, count in stacks.items())
+    return Response(
+        folded,
+        mimetype="text/plain",
+        headers={"Content-Disposition": f"attachment; filename={name[:-len('.json')]}.folded"},
+    )
+
+
 # === ELIZA API ===
 
 @app.route("/api/eliza-chat", methods=["POST"])
 def api_eliza_chat():
+    """
+    {"message": str} -> {"reply": str}, or in batch mode
+    {"messages": [str, ...]} -> {"replies": [str, ...]} (same order).
+    """
     data = request.get_json(silent=True) or {}
+    if "messages" in data:
+        messages = data.get("messages")
+        if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+            return jsonify({"error": "messages must be a list of strings"}), 400
+        if len(messages) > ELIZA_MAX_BATCH:
+            return jsonify({"error": f"At most {ELIZA_MAX_BATCH} messages per batch"}), 400
+        return jsonify({"replies": ELIZA.respond_batch(messages)})
+
     user_text = (data.get("message") or "").strip()
     if not user_text:
         return jsonify({"error": "Empty message"}), 400
@@ -544,7 +1353,24 @@ def api_eliza_chat():
     return jsonify({"reply": reply})
 
 
+def prepare_thread_store():
+    """
+    Create the threads/messages indexes and move threads saved with an
+    embedded `conversations` array into the messages collection (no-op once
+    done).
+    """
+    try:
+        THREAD_STORE.ensure_indexes()
+        migrated = THREAD_STORE.migrate_all()
+        if migrated:
+            print(f"Moved the messages of {migrated} thread(s) into the messages collection.")
+    except Exception as e:
+        print(f"Preparing the threads storage failed: {e}")
+
 
+rebuild_notes_index_in_background()
+if THREAD_STORE is not None:
+    threading.Thread(target=prepare_thread_store, daemon=True).start()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+# async_io.py
+import asyncio
+import threading
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_lock = threading.Lock()
+_loop = None
+_loop_thread = None
+_client = None
+
+
+def get_loop():
+    """
+    The one event loop of the process, running in a daemon thread. All async
+    I/O (Graph, Perplexity) is multiplexed on it, so a request that fans out
+    to many downloads does not need a thread per download.
+    """
+    global _loop, _loop_thread
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                _loop_thread = threading.Thread(target=loop.run_forever, name="async-io", daemon=True)
+                _loop_thread.start()
+                _loop = loop
+    return _loop
+
+
+def get_loop_thread_id():
+    """Thread ident of the shared loop (e.g. for a sampling profiler)."""
+    get_loop()
+    return _loop_thread.ident
+
+
+def run(coro, timeout=None):
+    """
+    Run a coroutine on the shared loop from synchronous (Flask) code and
+    wait for its result.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def spawn(coro):
+    """
+    Start a coroutine on the shared loop without waiting for it (background
+    work such as refreshing a thread summary). Returns its future.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def iter_async(async_iterable):
+    """
+    Iterate an async iterable living on the shared loop from synchronous code,
+    one item at a time (used to relay streamed LLM tokens to Flask).
+    """
+    iterator = async_iterable.__aiter__()
+
+    async def next_item():
+        return await iterator.__anext__()
+
+    while True:
+        try:
+            yield run(next_item())
+        except StopAsyncIteration:
+            return
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Shared keep-alive connection pool (HTTP/2 when available). Only use it
+    from coroutines running on get_loop().
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.AsyncClient(
+                    http2=HTTP2_AVAILABLE,
+                    timeout=HTTP_TIMEOUT,
+                    follow_redirects=True,
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    ),
+                )
+    return _client
@@ -0,0 +1,48 @@
+# benchmarks/bench_eliza.py
+"""
+Throughput of the ELIZA engine behind /api/eliza-chat, in a single process.
+
+    python benchmarks/bench_eliza.py [--replies 200000] [--batch 100]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eliza import ElizaEngine  # noqa: E402
+from fixtures import ELIZA_MESSAGES  # noqa: E402
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "eliza_rules.json")
+
+
+def run(engine, replies: int, batch: int):
+    messages = (ELIZA_MESSAGES * (batch // len(ELIZA_MESSAGES) + 1))[:batch]
+    rounds = max(1, replies // batch)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        engine.respond_batch(messages)
+    elapsed = time.perf_counter() - start
+    return rounds * batch, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ELIZA reply throughput.")
+    parser.add_argument("--replies", type=int, default=200000, help="Total replies to generate.")
+    parser.add_argument("--batch", type=int, default=100, help="Messages per respond_batch call.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    engine = ElizaEngine.load(RULES_PATH)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    run(engine, 1000, args.batch)  # warm-up
+    count, elapsed = run(engine, args.replies, args.batch)
+    print(f"rules loaded and compiled in {load_ms:.2f} ms")
+    print(f"{count} replies in {elapsed:.3f} s -> {count / elapsed:,.0f} replies/s "
+          f"({elapsed / count * 1e6:.2f} us/reply)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/fixtures.py
+"""
+Synthetic, deterministic data for the benchmarks: notes metadata, note
+texts, chat threads and chat messages. Nothing here touches the network.
+Also used by bench_eliza.py and the load-test stubs (loadtest/stub_servers.py).
+"""
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+VOCABULARY = (
+    "aws azure spark databricks sql python pandas numpy cluster pipeline "
+    "neural network machine learning deep model training gradient descent "
+    "regression classification feature vector embedding transformer attention "
+    "lambda storage bucket query index partition join window stream batch "
+    "github branch merge commit review deploy docker kubernetes terraform "
+    "lecture chapter summary exam homework project meeting notes idea plan"
+).split()
+
+ELIZA_MESSAGES = [
+    "Hello there",
+    "My name is Alex",
+    "I feel a bit anxious about my exams next week",
+    "I am tired of studying all the time",
+    "My mother keeps calling me every day",
+    "I argue with my father because he never listens",
+    "Why does this always happen to me?",
+    "I do not know what to say",
+    "Tell me something about yourself",
+    "It has been a long and strange week and I would rather not talk about work",
+]
+
+
+def make_notes(count: int, seed: int = 0, id_prefix: str = "BENCH"):
+    rng = random.Random(seed)
+    notes = []
+    for i in range(count):
+        topic = " ".join(rng.sample(VOCABULARY, 3)).title()
+        notes.append(
+            {
+                "id": f"01{id_prefix}{i:010d}",
+                "name": f"{topic} notes {i}.docx",
+                "webUrl": f"https://example.invalid/personal/drive/{i}",
+            }
+        )
+    return notes
+
+
+def make_text(words: int, rng: random.Random) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def make_documents(count: int, words: int = 400, seed: int = 0):
+    """(note, text) pairs, as iter_local_documents yields them."""
+    rng = random.Random(seed)
+    return [(note, make_text(words, rng)) for note in make_notes(count, seed)]
+
+
+def make_thread(turns: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    conversations = [
+        {
+            "seq": i + 1,
+            "user": make_text(25, rng) + "?",
+            "assistant": make_text(150, rng),
+            "citations": [f"https://example.invalid/source/{rng.randint(0, 999)}" for _ in range(3)],
+            "created_at": start + timedelta(minutes=i),
+        }
+        for i in range(turns)
+    ]
+    doc = {
+        "_id": ObjectId(),
+        "title": "Benchmark thread",
+        "message_count": turns,
+        "created_at": start,
+        "updated_at": start + timedelta(minutes=turns),
+    }
+    return doc, conversations
+
+
+def make_payload(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
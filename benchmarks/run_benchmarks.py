@@ -0,0 +1,307 @@
+# benchmarks/run_benchmarks.py
+"""
+Offline micro-benchmarks for the backend hot paths, on synthetic data.
+
+    python benchmarks/run_benchmarks.py                    # full run
+    python benchmarks/run_benchmarks.py --quick            # smaller sizes
+    python benchmarks/run_benchmarks.py --filter catalog   # only matching names
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<old>.json
+
+Results are written as JSON (benchmarks/results/ by default). With
+--compare, every benchmark whose median got slower than the baseline by more
+than --threshold is reported and the exit code is 1.
+"""
+import os
+import sys
+import atexit
+import json
+import time
+import base64
+import shutil
+import platform
+import argparse
+import itertools
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# app_backend reads these at import; keep it away from real services and the
+# real note files (it starts indexing NOTE_FILES_DIR in the background at import)
+os.environ.setdefault("PERPLEXITY_API_KEY", "benchmark")
+os.environ["MONGO_URL"] = ""
+APP_DIR = tempfile.mkdtemp(prefix="notes-bench-app-")
+os.environ.update(
+    {
+        "NOTES_METADATA_PATH": os.path.join(APP_DIR, "notes_metadata.json"),
+        "NOTES_DELTA_STATE_PATH": os.path.join(APP_DIR, "notes_delta.json"),
+        "NOTE_FILES_DIR": os.path.join(APP_DIR, "note_files"),
+        "DOCUMENT_CACHE_DIR": os.path.join(APP_DIR, "document_cache"),
+        "TEXT_CACHE_DIR": os.path.join(APP_DIR, "text_cache"),
+        "SUMMARY_CACHE_PATH": os.path.join(APP_DIR, "summary_cache.json"),
+        "PROFILE_DIR": os.path.join(APP_DIR, "profiles"),
+    }
+)
+atexit.register(shutil.rmtree, APP_DIR, ignore_errors=True)
+
+import app_backend  # noqa: E402
+import fixtures  # noqa: E402
+from notes_catalog import NotesCatalog  # noqa: E402
+from notes_index import NotesIndex  # noqa: E402
+from chunk_store import ChunkStore  # noqa: E402
+from suggest_index import SuggestIndex  # noqa: E402
+from search_cache import SearchCache  # noqa: E402
+from context_packer import pack_context  # noqa: E402
+
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+
+
+def measure(func, number: int, repeat: int):
+    """Seconds per call of func(), over `repeat` rounds of `number` calls."""
+    func()  # warm-up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    median = statistics.median(times)
+    return {
+        "number": number,
+        "repeat": repeat,
+        "median_s": median,
+        "mean_s": statistics.fmean(times),
+        "min_s": min(times),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "ops_per_s": 1 / median if median else None,
+    }
+
+
+# --- benchmark cases: each returns (func, number) once its fixtures are set up ---
+
+def bench_eliza_respond():
+    messages = itertools.cycle(fixtures.ELIZA_MESSAGES)
+    return lambda: app_backend.eliza_respond(next(messages)), 5000
+
+
+def bench_eliza_reflect():
+    fragment = "my mother says I am never going to finish your project because I'd rather sleep"
+    return lambda: app_backend.reflect(fragment), 20000
+
+
+def catalog_at(tmp_dir, size):
+    path = os.path.join(tmp_dir, f"notes_metadata_{size}.json")
+    if not os.path.exists(path):
+        with open(path, "w") as f:
+            json.dump(fixtures.make_notes(size), f, indent=2)
+    return path
+
+
+def bench_catalog_load_cold(tmp_dir, size):
+    path = catalog_at(tmp_dir, size)
+
+    def run():
+        app_backend.NOTES_CATALOG = NotesCatalog(path)
+        app_backend.load_notes_metadata()
+    return run, 2
+
+
+def bench_catalog_load_warm(tmp_dir, size):
+    app_backend.NOTES_CATALOG = NotesCatalog(catalog_at(tmp_dir, size))
+    return app_backend.load_notes_metadata, 20
+
+
+def bench_catalog_append(tmp_dir, size):
+    path = os.path.join(tmp_dir, f"append_{size}.json")
+    shutil.copy(catalog_at(tmp_dir, size), path)
+    app_backend.NOTES_CATALOG = NotesCatalog(path)
+    counter = itertools.count()
+
+    def run():
+        i = next(counter)
+        app_backend.append_note_metadata_if_missing(f"01NEW{i:010d}", f"New notes {i}.docx", "https://example.invalid/new")
+    return run, 200
+
+
+def bench_catalog_lookup(tmp_dir, size):
+    app_backend.NOTES_CATALOG = NotesCatalog(catalog_at(tmp_dir, size))
+    ids = itertools.cycle([note["id"] for note in fixtures.make_notes(1000)])
+    return lambda: app_backend.NOTES_CATALOG.get(next(ids)), 20000
+
+
+def bench_base64(size):
+    payload = fixtures.make_payload(size)
+    return lambda: base64.b64encode(payload).decode("utf-8"), max(1, 20 * 1024 * 1024 // size)
+
+
+def bench_serialize_thread(turns):
+    doc, conversations = fixtures.make_thread(turns)
+    json_provider = app_backend.app.json
+
+    def run():
+        json_provider.dumps(app_backend.serialize_thread(doc, conversations, None))
+    return run, max(1, 20000 // turns)
+
+
+def bench_index_build(docs):
+    documents = fixtures.make_documents(docs)
+    return lambda: NotesIndex().build(documents), 1
+
+
+def bench_index_search(docs):
+    index = NotesIndex()
+    index.build(fixtures.make_documents(docs))
+    queries = itertools.cycle(["spark sql join", "neural network training", "azure storage bucket", "exam"])
+    return lambda: index.search(next(queries)), 200
+
+
+def bench_chunks_build(docs):
+    documents = fixtures.make_documents(docs)
+    return lambda: ChunkStore().build(documents), 1
+
+
+def bench_chunks_search(docs):
+    store = ChunkStore()
+    store.build(fixtures.make_documents(docs))
+    queries = itertools.cycle(["spark sql join", "neural network training", "azure storage bucket"])
+    return lambda: store.search(next(queries), 6), 100
+
+
+def bench_suggest(notes):
+    index = SuggestIndex()
+    index.set_notes(fixtures.make_notes(notes))
+    built = NotesIndex()
+    built.build(fixtures.make_documents(500))
+    index.set_terms(built.frequent_terms(20000))
+    prefixes = itertools.cycle(["a", "sp", "neural n", "mach", "lambda st", "zz"])
+    return lambda: index.suggest(next(prefixes)), 5000
+
+
+def bench_search_cache_hit():
+    cache = SearchCache(1000, 300)
+    for i in range(1000):
+        cache.put(cache.key(f"query {i}", 50), {"results": [], "next_cursor": None})
+    queries = itertools.cycle([f"  Query {i} " for i in range(0, 1000, 7)])
+    return lambda: cache.get(cache.key(next(queries), 50)), 20000
+
+
+def bench_context_pack(blocks):
+    rng = fixtures.random.Random(0)
+    items = [{"block": {"type": "text", "text": "What did I write about spark joins?"}, "label": "question", "required": True}]
+    items += [
+        {"block": {"type": "text", "text": fixtures.make_text(300, rng)}, "label": f"note {i}"}
+        for i in range(blocks)
+    ]
+    return lambda: pack_context(items, 12000), 500
+
+
+def cases(tmp_dir, quick: bool):
+    catalog_sizes = [10000] if quick else [10000, 50000, 100000]
+    index_docs = 500 if quick else 2000
+    yield "eliza.respond", {}, bench_eliza_respond
+    yield "eliza.reflect", {}, bench_eliza_reflect
+    for size in catalog_sizes:
+        yield "catalog.load_cold", {"notes": size}, lambda size=size: bench_catalog_load_cold(tmp_dir, size)
+        yield "catalog.load_warm", {"notes": size}, lambda size=size: bench_catalog_load_warm(tmp_dir, size)
+        yield "catalog.append_if_missing", {"notes": size}, lambda size=size: bench_catalog_append(tmp_dir, size)
+        yield "catalog.get", {"notes": size}, lambda size=size: bench_catalog_lookup(tmp_dir, size)
+    for size in ([1024 * 1024] if quick else [100 * 1024, 1024 * 1024, 10 * 1024 * 1024]):
+        yield "attachments.base64", {"bytes": size}, lambda size=size: bench_base64(size)
+    for turns in ([1000] if quick else [100, 1000, 10000]):
+        yield "threads.serialize", {"turns": turns}, lambda turns=turns: bench_serialize_thread(turns)
+    yield "search.index_build", {"docs": index_docs}, lambda: bench_index_build(index_docs)
+    yield "search.index_search", {"docs": index_docs}, lambda: bench_index_search(index_docs)
+    yield "search.chunks_build", {"docs": index_docs}, lambda: bench_chunks_build(index_docs)
+    yield "search.chunks_search", {"docs": index_docs}, lambda: bench_chunks_search(index_docs)
+    yield "search.suggest", {"notes": catalog_sizes[-1]}, lambda: bench_suggest(catalog_sizes[-1])
+    yield "search.cache_hit", {}, bench_search_cache_hit
+    yield "context.pack", {"blocks": 50}, lambda: bench_context_pack(50)
+
+
+def result_name(name, params):
+    if not params:
+        return name
+    return name + "[" + ",".join(f"{k}={v}" for k, v in params.items()) + "]"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, "r") as f:
+        baseline = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get(result["name"])
+        if not old:
+            continue
+        ratio = result["median_s"] / old["median_s"] if old["median_s"] else 1.0
+        result["baseline_median_s"] = old["median_s"]
+        result["change"] = round(ratio - 1, 4)
+        if ratio - 1 > threshold:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for the backend hot paths.")
+    parser.add_argument("--quick", action="store_true", help="Smaller fixtures and fewer sizes.")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed rounds per benchmark.")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/bench-<time>.json).")
+    parser.add_argument("--compare", help="Baseline result file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Slowdown vs. baseline reported as a regression (0.25 = 25%%).")
+    args = parser.parse_args()
+
+    original_catalog = app_backend.NOTES_CATALOG
+    results = []
+    tmp_dir = tempfile.mkdtemp(prefix="notes-bench-")
+    try:
+        for name, params, setup in cases(tmp_dir, args.quick):
+            full_name = result_name(name, params)
+            if args.filter not in full_name:
+                continue
+            func, number = setup()
+            result = {"name": full_name, "benchmark": name, "params": params}
+            result.update(measure(func, number, args.repeat))
+            results.append(result)
+            print(f"{full_name:<50} {result['median_s'] * 1e6:>14,.2f} us  {result['ops_per_s']:>14,.1f} ops/s")
+    finally:
+        app_backend.NOTES_CATALOG = original_catalog
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else []
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "baseline": args.compare,
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(results)} results to {output}")
+
+    for result in regressions:
+        print(f"REGRESSION {result['name']}: {result['change']:+.1%} vs baseline")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
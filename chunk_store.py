@@ -0,0 +1,185 @@
+# chunk_store.py
+import math
+import heapq
+from collections import Counter
+
+from notes_index import tokenize
+
+PASSAGE_WORDS = 120
+PASSAGE_OVERLAP_WORDS = 30
+
+
+def split_passages(text: str, size: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP_WORDS):
+    """
+    Split text into passages of about `size` words, each sharing `overlap`
+    words with the previous one so an answer spanning a boundary is kept
+    whole in at least one passage.
+    """
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, size - overlap)
+    passages = []
+    for start in range(0, len(words), step):
+        passages.append(" ".join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return passages
+
+
+def _tfidf_vector(tokens, idf, default_idf):
+    counts = Counter(tokens)
+    vector = {
+        term: (1 + math.log(tf)) * idf.get(term, default_idf)
+        for term, tf in counts.items()
+    }
+    norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+    return {term: w / norm for term, w in vector.items()}
+
+
+class ChunkStore:
+    """
+    Overlapping passages of every note, with sparse TF-IDF vectors (cosine
+    similarity) for picking the few passages relevant to a chat message.
+    CPU only and pure Python, like NotesIndex: each build or update makes a
+    new state that is swapped in whole, and an update only splits and
+    tokenizes the notes that changed.
+    """
+
+    def __init__(self):
+        self._state = None
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    def __len__(self):
+        return len(self._state["passages"]) if self._state else 0
+
+    def build(self, documents):
+        """
+        Build the store from an iterable of (note_metadata, text) pairs.
+        """
+        self._swap_in(*self._split(documents))
+
+    def update(self, documents, remove_ids=()):
+        """
+        Add or replace the passages of the notes in `documents` and drop
+        those of the notes in `remove_ids`; other notes keep theirs.
+        """
+        new_passages, new_tokens = self._split(documents)
+        state = self._state
+        if state is None:
+            self._swap_in(new_passages, new_tokens)
+            return
+        dropped = set(remove_ids) | {note.get("id") for note, _ in documents}
+        kept = [
+            (passage, tokens)
+            for passage, tokens in zip(state["passages"], state["passage_tokens"])
+            if passage["note_id"] not in dropped
+        ]
+        self._swap_in(
+            [passage for passage, _ in kept] + new_passages,
+            [tokens for _, tokens in kept] + new_tokens,
+        )
+
+    @staticmethod
+    def _split(documents):
+        passages = []
+        passage_tokens = []
+        for note, text in documents:
+            for passage in split_passages(text):
+                tokens = tokenize(passage)
+                if not tokens:
+                    continue
+                passages.append(
+                    {"note_id": note.get("id"), "note_name": note.get("name", ""), "text": passage}
+                )
+                passage_tokens.append(tokens)
+        return passages, passage_tokens
+
+    def _swap_in(self, passages, passage_tokens):
+        df = Counter()
+        for tokens in passage_tokens:
+            df.update(set(tokens))
+
+        n = len(passages)
+        idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+        default_idf = math.log(1 + n) + 1
+
+        postings = {}
+        for idx, tokens in enumerate(passage_tokens):
+            for term, weight in _tfidf_vector(tokens, idf, default_idf).items():
+                postings.setdefault(term, []).append((idx, weight))
+
+        self._state = {
+            "passages": passages,
+            "passage_tokens": passage_tokens,
+            "postings": postings,
+            "idf": idf,
+            "default_idf": default_idf,
+        }
+
+    def _query_vector(self, query: str):
+        state = self._state
+        idf = state["idf"] if state else {}
+        default_idf = state["default_idf"] if state else 1.0
+        return _tfidf_vector(tokenize(query), idf, default_idf)
+
+    def search(self, query: str, k: int, note_ids=None):
+        """
+        Top-k passages for `query`, optionally restricted to some notes.
+        """
+        state = self._state
+        if not state:
+            return []
+        allowed = set(note_ids) if note_ids else None
+        passages = state["passages"]
+        scores = {}
+        for term, q_weight in self._query_vector(query).items():
+            for idx, weight in state["postings"].get(term, ()):
+                if allowed is not None and passages[idx]["note_id"] not in allowed:
+                    continue
+                scores[idx] = scores.get(idx, 0.0) + q_weight * weight
+        best = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+        return [dict(passages[idx], score=round(score, 4)) for idx, score in best]
+
+    def rank_documents(self, query: str, documents, k: int):
+        """
+        Top-k passages for `query` from (note_metadata, text) pairs that may
+        not be in the store (e.g. notes not downloaded locally), scored with
+        the store's IDF statistics. The notes were attached on purpose, so
+        when fewer than k passages match the query (e.g. "summarize this"),
+        the remaining slots go to each note's leading passages, taking the
+        notes in turn.
+        """
+        query_vector = self._query_vector(query)
+        state = self._state
+        idf = state["idf"] if state else {}
+        default_idf = state["default_idf"] if state else 1.0
+
+        scored = []
+        by_note = []  # each note's passages in order
+        for note, text in documents:
+            note_passages = []
+            for passage in split_passages(text):
+                entry = {"note_id": note.get("id"), "note_name": note.get("name", ""), "text": passage}
+                note_passages.append(entry)
+                vector = _tfidf_vector(tokenize(passage), idf, default_idf)
+                score = sum(w * vector.get(term, 0.0) for term, w in query_vector.items())
+                if score > 0:
+                    scored.append((score, entry))
+            by_note.append(note_passages)
+        best = heapq.nlargest(k, scored, key=lambda pair: pair[0])
+        results = [dict(passage, score=round(score, 4)) for score, passage in best]
+
+        chosen = {id(passage) for _, passage in best}
+        position = 0
+        while len(results) < k and any(position < len(p) for p in by_note):
+            for note_passages in by_note:
+                if len(results) >= k:
+                    break
+                if position < len(note_passages) and id(note_passages[position]) not in chosen:
+                    results.append(dict(note_passages[position], score=0.0))
+            position += 1
+        return results
@@ -0,0 +1,108 @@
+# context_packer.py
+import math
+
+# rough average for English text with the tokenizers the sonar models use
+CHARS_PER_TOKEN = 4
+# a truncated piece shorter than this is not worth sending
+MIN_TRUNCATED_TOKENS = 64
+TRUNCATION_MARKER = " [...truncated]"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def block_tokens(block) -> int:
+    # file_url blocks are documents the API reads itself, not prompt text, so
+    # their (base64) size says nothing about prompt tokens; see file_block_bytes
+    if block.get("type") == "text":
+        return estimate_tokens(block["text"])
+    return 0
+
+
+def file_block_bytes(block) -> int:
+    if block.get("type") == "file_url":
+        return len(block["file_url"].get("url") or "")
+    return 0
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = max(0, tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARKER))
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[: cut if cut > 0 else limit] + TRUNCATION_MARKER
+
+
+def even_shares(sizes, budget: int):
+    """
+    Split `budget` across blocks of the given token sizes: every block gets an
+    equal share, and what a small block does not need goes to the others.
+    """
+    shares = [0] * len(sizes)
+    remaining = budget
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    for position, i in enumerate(order):
+        shares[i] = min(sizes[i], remaining // (len(order) - position))
+        remaining -= shares[i]
+    return shares
+
+
+def pack_context(items, budget: int, split_evenly: bool = False, file_budget_bytes: int = None):
+    """
+    Fit message content blocks into a token budget.
+
+    `items` is a list of {"block", "label", "required"} dicts in priority
+    order (most important first). Required blocks (the question) are always
+    kept whole and counted against the budget. File blocks do not count
+    against it; they are kept while their encoded size fits in
+    `file_budget_bytes` (no limit when None) and dropped otherwise, since a
+    file cannot be cut. The other blocks are kept whole while they fit; a text block that does not fit is truncated to the remaining
+    budget when enough of it would be left, otherwise dropped. With
+    split_evenly, the budget is shared evenly between the optional blocks
+    instead of going to the first ones (e.g. one summary per attached note).
+
+    Returns (blocks, report) where blocks keep their original order and the
+    report lists the estimated tokens and file bytes used and what was
+    truncated or dropped.
+    """
+    remaining = budget - sum(block_tokens(item["block"]) for item in items if item.get("required"))
+    file_bytes = 0
+    kept = []
+    report = {"budget": budget, "used_tokens": 0, "file_bytes": 0, "truncated": [], "dropped": []}
+
+    optional = [item for item in items if not item.get("required")]
+    shares = {}
+    if split_evenly:
+        sizes = [block_tokens(item["block"]) for item in optional]
+        shares = {id(item): share for item, share in zip(optional, even_shares(sizes, max(0, remaining)))}
+
+    for item in items:
+        block = item["block"]
+        tokens = block_tokens(block)
+        if item.get("required"):
+            kept.append(block)
+            continue
+        if block.get("type") == "file_url":
+            size = file_block_bytes(block)
+            if file_budget_bytes is None or file_bytes + size <= file_budget_bytes:
+                kept.append(block)
+                file_bytes += size
+            else:
+                report["dropped"].append(item["label"])
+            continue
+        allowed = shares.get(id(item), remaining)
+        if tokens <= allowed:
+            kept.append(block)
+            remaining -= tokens
+        elif block.get("type") == "text" and allowed >= MIN_TRUNCATED_TOKENS:
+            text = truncate_to_tokens(block["text"], allowed)
+            kept.append(dict(block, text=text))
+            remaining -= estimate_tokens(text)
+            report["truncated"].append(item["label"])
+        else:
+            report["dropped"].append(item["label"])
+
+    report["used_tokens"] = budget - remaining
+    report["file_bytes"] = file_bytes
+    return kept, report
@@ -0,0 +1,106 @@
+# document_cache.py
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def _digest(value: str, length: int) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:length]
+
+
+class DocumentCache:
+    """
+    On-disk cache of document bytes keyed by (item id, version tag), where the
+    version tag is the Graph cTag/eTag of the item. A new version of a note
+    gets a new key, so stale content is never served.
+
+    Entries are evicted least-recently-used first once the total size goes
+    over `max_bytes`. Recency survives restarts through file mtimes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # file name -> size, oldest first
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+
+    @staticmethod
+    def _item_prefix(item_id: str) -> str:
+        return _digest(item_id, 32)
+
+    def _file_name(self, item_id: str, version: str) -> str:
+        return f"{self._item_prefix(item_id)}-{_digest(version or '', 16)}"
+
+    def contains(self, item_id: str, version: str) -> bool:
+        with self._lock:
+            return self._file_name(item_id, version) in self._entries
+
+    def get(self, item_id: str, version: str):
+        name = self._file_name(item_id, version)
+        path = os.path.join(self.cache_dir, name)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._forget(name)
+            return None
+        return data
+
+    def put(self, item_id: str, version: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        name = self._file_name(item_id, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(self.cache_dir, name))
+
+        with self._lock:
+            # older versions of the same note are never read again
+            prefix = self._item_prefix(item_id) + "-"
+            for old in [n for n in self._entries if n.startswith(prefix) and n != name]:
+                self._remove(old)
+            self._forget(name)
+            self._entries[name] = len(data)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _forget(self, name):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _remove(self, name):
+        self._forget(name)
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
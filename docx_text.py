@@ -0,0 +1,76 @@
+# docx_text.py
+import io
+import zipfile
+import xml.etree.ElementTree as ET
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _paragraph_prefix(p) -> str:
+    """
+    Markdown-style prefix for headings and list items, so the structure of
+    the note survives in the plain text.
+    """
+    ppr = p.find(f"{W_NS}pPr")
+    if ppr is None:
+        return ""
+
+    style = ppr.find(f"{W_NS}pStyle")
+    style_name = (style.get(f"{W_NS}val") or "") if style is not None else ""
+    if style_name == "Title":
+        return "# "
+    if style_name.lower().startswith("heading"):
+        level = "".join(ch for ch in style_name if ch.isdigit())
+        return "#" * min(int(level or 1), 6) + " "
+
+    num_pr = ppr.find(f"{W_NS}numPr")
+    if num_pr is not None or style_name.lower().startswith("list"):
+        ilvl = num_pr.find(f"{W_NS}ilvl") if num_pr is not None else None
+        depth = int(ilvl.get(f"{W_NS}val") or 0) if ilvl is not None else 0
+        return "  " * depth + "- "
+    return ""
+
+
+def _paragraph_text(p) -> str:
+    parts = []
+    for el in p.iter():
+        if el.tag == f"{W_NS}t":
+            parts.append(el.text or "")
+        elif el.tag == f"{W_NS}tab":
+            parts.append("\t")
+        elif el.tag in (f"{W_NS}br", f"{W_NS}cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def extract_docx_text(source) -> str:
+    """
+    Return the text of a .docx file, one paragraph per line, with headings as
+    "#"-prefixed lines and list items as "- " bullets. `source` can be a file
+    path or the raw .docx bytes.
+
+    word/document.xml is streamed out of the zip and parsed incrementally, so
+    embedded images and other parts are never read into memory.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+
+    lines = []
+    with zipfile.ZipFile(source) as zf:
+        with zf.open("word/document.xml") as xml_file:
+            depth = 0
+            for event, el in ET.iterparse(xml_file, events=("start", "end")):
+                if el.tag != f"{W_NS}p":
+                    continue
+                if event == "start":
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth:
+                    # nested paragraph (e.g. text box); the outer one includes it
+                    continue
+                text = _paragraph_text(el)
+                if text.strip():
+                    lines.append(_paragraph_prefix(el) + text)
+                el.clear()
+    return "\n".join(lines)
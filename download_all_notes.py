@@ -1,99 +1,160 @@
 import os
 import json
-import atexit
-import requests
-
-from msal import PublicClientApplication, SerializableTokenCache
-from dotenv import load_dotenv
-
-load_dotenv()
-
-CLIENT_ID = os.getenv("CLIENT_ID")
-AUTHORITY = "https://login.microsoftonline.com/common"
-SCOPES = ["Files.Read.All"]
-CACHE_FILE = os.path.join(os.path.dirname(__file__), "token_cache.bin")
-
-
-
-def load_cache():
-    cache = SerializableTokenCache()
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as f:
-            cache.deserialize(f.read())
-    # persist cache on exit only if changed
-    atexit.register(
-        lambda: open(CACHE_FILE, "w").write(cache.serialize())
-        if cache.has_state_changed
-        else None
-    )
-    return cache
-
-
-
-def get_token(app): #NOTE: token will last for 1 hour
-    # 1. Try silent first (no user interaction if cache has valid tokens)
-    accounts = app.get_accounts()
-    if accounts:
-        result = app.acquire_token_silent(SCOPES, account=accounts[0])
-        if result and "access_token" in result:
-            return result["access_token"]
-
-    # 2. Fallback to device flow (first run or no valid refresh token)
-    flow = app.initiate_device_flow(scopes=SCOPES)
-    if "user_code" not in flow:
-        raise RuntimeError("Failed to create device flow. Check app registration.")
-    print("Go to", flow["verification_uri"], "and enter code:", flow["user_code"])
-    result = app.acquire_token_by_device_flow(flow)
-    if "access_token" in result:
-        return result["access_token"]
-
-    raise RuntimeError("Authentication failed: {}".format(result.get("error_description")))
-
+import asyncio
+import hashlib
+import argparse
+
+import httpx
+
+import async_io
+from get_authentication import TokenProvider
+from graph_client import GraphClient, backoff_delay
+from notes_sync import sync_notes_metadata, write_json_atomic
+from notes_catalog import NotesCatalog
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+NOTES_METADATA_PATH = os.path.join(BASE_DIR, "notes_metadata.json")
+NOTES_DELTA_STATE_PATH = os.path.join(BASE_DIR, "notes_delta.json")
+NOTE_FILES_DIR = os.path.join(BASE_DIR, "note_files")
+MANIFEST_PATH = os.path.join(NOTE_FILES_DIR, "manifest.json")
+
+CHUNK_SIZE = 1024 * 1024
+
+#total of 51 files for about 750 MB total; used to take 10-20 minutes sequentially
+#and often needed several runs due to requests timeouts
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, "r") as f:
+        return json.load(f)
+
+
+def note_version(note):
+    return note.get("cTag") or note.get("eTag") or ""
+
+
+def needs_download(note, manifest):
+    entry = manifest.get(note["id"])
+    if not entry or not os.path.exists(os.path.join(NOTE_FILES_DIR, note["id"])):
+        return True
+    if entry.get("version") != note_version(note):
+        return True
+    return note.get("size") is not None and entry.get("size") != note.get("size")
+
+
+def partial_path(note):
+    # the version is part of the name so a partial file of an older
+    # version is never resumed into the new one
+    version_hash = hashlib.sha256(note_version(note).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(NOTE_FILES_DIR, f"{note['id']}.{version_hash}.part")
+
+
+async def adownload_note(note, graph, max_retries=5):
+    """
+    Stream one note to note_files/<id>, resuming an existing partial download
+    with an HTTP Range request. The Graph client already retries throttled and
+    failed requests; this loop also resumes after a connection drops mid-body.
+    """
+    final_path = os.path.join(NOTE_FILES_DIR, note["id"])
+    part_path = partial_path(note)
+    path = f"/me/drive/items/{note['id']}/content"
+
+    for attempt in range(max_retries + 1):
+        try:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else None
+
+            async with graph.astream("GET", path, headers=headers) as response:
+                if response.status_code == 416:
+                    # partial file already holds the whole document
+                    pass
+                else:
+                    response.raise_for_status()
+                    mode = "ab" if response.status_code == 206 else "wb"
+                    with open(part_path, mode) as f:
+                        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                            f.write(chunk)
+
+            size = os.path.getsize(part_path)
+            if note.get("size") is not None and size != note["size"]:
+                # a bad partial file cannot be resumed (past EOF every Range gets 416): start over
+                os.remove(part_path)
+                raise IOError(f"size mismatch: got {size} bytes, expected {note['size']}")
+            os.replace(part_path, final_path)
+            return size
+        except (httpx.HTTPError, IOError) as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Retrying {note['name']} in {delay:.1f}s after error: {e}")
+            await asyncio.sleep(delay)
+
+
+async def async_sync_notes(notes, graph, workers=4, max_retries=5):
+    os.makedirs(NOTE_FILES_DIR, exist_ok=True)
+    manifest = load_manifest()
+
+    pending = [note for note in notes if needs_download(note, manifest)]
+    print(f"{len(notes)} notes, {len(notes) - len(pending)} up to date, {len(pending)} to download.")
+
+    semaphore = asyncio.Semaphore(workers)
+    failed = []
+    done_count = 0
+
+    async def download(note):
+        nonlocal done_count
+        async with semaphore:
+            try:
+                size = await adownload_note(note, graph, max_retries)
+            except Exception as e:
+                done_count += 1
+                print(f"[{done_count}/{len(pending)}] Failed to download {note['name']}: {e}")
+                failed.append(note)
+                return
+        done_count += 1
+        print(f"[{done_count}/{len(pending)}] Downloaded {note['name']} ({size} bytes)")
+        manifest[note["id"]] = {
+            "name": note.get("name"),
+            "version": note_version(note),
+            "size": size,
+        }
+        write_json_atomic(MANIFEST_PATH, manifest, indent=2)
+
+    await asyncio.gather(*(download(note) for note in pending))
+    return failed
+
+
+def sync_notes(notes, graph, workers=4, max_retries=5):
+    """
+    Download every note that is missing locally or changed since the last run,
+    in parallel, and record finished files in note_files/manifest.json.
+    """
+    return async_io.run(async_sync_notes(notes, graph, workers, max_retries))
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync note metadata and .docx files from OneDrive.")
+    parser.add_argument("--metadata-only", action="store_true", help="only refresh notes_metadata.json")
+    parser.add_argument("--workers", type=int, default=4, help="parallel downloads")
+    parser.add_argument("--retries", type=int, default=5, help="retries per file")
+    args = parser.parse_args()
+
+    token_provider = TokenProvider()
+    # authorize up front: the device flow prints its code here, before any download starts
+    if not token_provider.get_access_token(interactive=True):
+        raise SystemExit("Could not get a Microsoft Graph access token.")
+    graph = GraphClient(token_provider.get_headers)
+    list_of_notes, changes = sync_notes_metadata(
+        graph, NotesCatalog(NOTES_METADATA_PATH), NOTES_DELTA_STATE_PATH
+    )
+    print(
+        f"Found {len(list_of_notes)} notes ({len(changes['added'])} added, "
+        f"{len(changes['updated'])} updated, {len(changes['removed'])} removed)."
+    )
 
-    cache = load_cache()
-    app = PublicClientApplication(client_id=CLIENT_ID, authority=AUTHORITY, token_cache=cache)
-    access_token = get_token(app)
-
-    headers = {"Authorization": f"Bearer {access_token}"}
-
-
-
-    url = f"https://graph.microsoft.com/v1.0/me/drive/root/search(q='notes')?$filter=endswith(name,'.docx')&$select=name,id,webUrl"
-
-
-    response = requests.get(url, headers=headers)
-
-    list_of_notes = response.json()['value']
-
-    #write list of notes to json file
-    with open("notes_metadata.json", "w") as f:
-        json.dump(list_of_notes, f)
-
-    # print(f"Found {len(list_of_notes)} notes.")
-    # count = 0
-    # os.makedirs("note_files", exist_ok=True)
-    # for note in list_of_notes:
-    #     #check if file already exists
-    #     if os.path.exists(f"note_files/{note['id']}"):
-    #         print(f"File {note['name']} already exists. Skipping download.")
-    #         count += 1
-    #         continue
-    #     print(f"Downloading note #{count + 1} of {len(list_of_notes)}: {note['name']}")
-    #     note_id = note['id']
-    #     download_url = f"https://graph.microsoft.com/v1.0/me/drive/items/{note_id}/content"
-    #     download_response = requests.get(download_url, headers=headers)
-    #     if download_response.status_code == 200:    
-    #         # store as binary file
-    #         with open(f"note_files/{note_id}", "wb") as f:
-    #             f.write(download_response.content)
-    #     else:
-    #         print(f"Failed to download {note['name']}")
-    #     count += 1
-
-
-#total of 51 files for about 750 MB total
-
-# 10-20 minutes to download all files; may need to run multiple times due to requests timeouts
\ No newline at end of file
+    if not args.metadata_only:
+        failed = sync_notes(list_of_notes, graph, workers=args.workers, max_retries=args.retries)
+        if failed:
+            print(f"{len(failed)} notes failed; run again to resume them.")
@@ -0,0 +1,100 @@
+# eliza.py
+import re
+import json
+import random
+
+KEYWORD_RE = re.compile(r"[a-z']+|\?")
+TEMPLATE_SLOT_RE = re.compile(r"%(\d+)")
+
+
+def compile_template(template: str):
+    """
+    Split a reassembly template into literal strings and group numbers, so
+    "Why do you feel %1?" becomes ["Why do you feel ", 1, "?"].
+    """
+    parts = TEMPLATE_SLOT_RE.split(template)
+    return [int(part) if i % 2 else part for i, part in enumerate(parts) if part or i % 2]
+
+
+class ElizaEngine:
+    """
+    Classic keyword-ranked ELIZA. Rules (see eliza_rules.json) name their
+    keywords and a rank; every decomposition pattern is compiled once and
+    every reassembly template pre-split. A reply only tries the rules whose
+    keywords occur in the input (as whole words, ignoring a possessive 's,
+    or anywhere in the text for rules marked "substring", e.g. "mother" in
+    "grandmother"), highest rank first, and within a rule its
+    decompositions in order; the first pattern that matches picks a random
+    reassembly, filled with the reflected matched groups. Without a match
+    the fallback replies are used.
+    """
+
+    def __init__(self, rules):
+        self.reflections = dict(rules.get("reflections", {}))
+        self.empty_reply = rules.get("empty", "Please go on.")
+        self.fallback = [compile_template(t) for t in rules.get("fallback", [])] or [[self.empty_reply]]
+
+        self._keyword_index = {}
+        self._substring_keywords = []  # (keyword, rule) for "substring" rules
+        for order, rule in enumerate(rules.get("rules", [])):
+            compiled = (
+                -rule.get("rank", 0),
+                order,
+                [
+                    (
+                        re.compile(d["pattern"], re.IGNORECASE),
+                        [compile_template(t) for t in d["responses"]],
+                    )
+                    for d in rule["decompositions"]
+                ],
+            )
+            for keyword in rule["keywords"]:
+                if rule.get("substring"):
+                    self._substring_keywords.append((keyword.lower(), compiled))
+                else:
+                    self._keyword_index.setdefault(keyword.lower(), []).append(compiled)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def reflect(self, fragment: str) -> str:
+        get = self.reflections.get
+        return " ".join([get(w, w) for w in fragment.lower().split()])
+
+    def _candidates(self, text: str):
+        index = self._keyword_index
+        lowered = text.lower()
+        words = set(KEYWORD_RE.findall(lowered))
+        words.update([word[:-2] for word in words if word.endswith("'s")])
+        found = [rule for word in words for rule in index.get(word, ())]
+        found += [rule for keyword, rule in self._substring_keywords if keyword in lowered]
+        if len(found) > 1:
+            # the same rule can be reached through several of its keywords
+            found = sorted({id(rule): rule for rule in found}.values(), key=lambda rule: rule[:2])
+        return found
+
+    def _reassemble(self, parts, match=None):
+        out = []
+        for part in parts:
+            if isinstance(part, int):
+                group = match.group(part) if match is not None and part <= match.re.groups else None
+                out.append(self.reflect(group or ""))
+            else:
+                out.append(part)
+        return "".join(out)
+
+    def respond(self, text: str) -> str:
+        text = text.strip()
+        if not text:
+            return self.empty_reply
+        for _, _, decompositions in self._candidates(text):
+            for pattern, responses in decompositions:
+                m = pattern.match(text)
+                if m:
+                    return self._reassemble(random.choice(responses), m)
+        return self._reassemble(random.choice(self.fallback))
+
+    def respond_batch(self, texts):
+        return [self.respond(text) for text in texts]
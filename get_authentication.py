@@ -1,6 +1,9 @@
 import os
 import json
+import time
 import atexit
+import tempfile
+import threading
 import requests
 
 from msal import PublicClientApplication, SerializableTokenCache
@@ -14,6 +17,26 @@ SCOPES = ["Files.Read.All"]
 CACHE_FILE = os.path.join(os.path.dirname(__file__), "token_cache.bin")
 
 
+class GraphAuthError(RuntimeError):
+    """No usable Graph token; the user has to authorize (Page 1 or a script's device flow)."""
+
+
+def merge_cache_states(*states):
+    """
+    Union of serialized MSAL token caches, entry by entry; entries from later
+    states win. Lets two processes share token_cache.bin without dropping
+    each other's tokens.
+    """
+    merged = {}
+    for state in states:
+        for section, entries in (json.loads(state) if state else {}).items():
+            if isinstance(entries, dict):
+                merged.setdefault(section, {}).update(entries)
+            else:
+                merged[section] = entries
+    return json.dumps(merged, indent=4)
+
+
 
 def load_cache():
     cache = SerializableTokenCache()
@@ -30,13 +53,16 @@ def load_cache():
 
 
 
-def get_token(app): #NOTE: token will last for 1 hour
+def acquire_token_result(app, interactive=True):
     # 1. Try silent first (no user interaction if cache has valid tokens)
     accounts = app.get_accounts()
     if accounts:
         result = app.acquire_token_silent(SCOPES, account=accounts[0])
         if result and "access_token" in result:
-            return result["access_token"]
+            return result
+
+    if not interactive:
+        return None
 
     # 2. Fallback to device flow (first run or no valid refresh token)
     flow = app.initiate_device_flow(scopes=SCOPES)
@@ -45,11 +71,170 @@ def get_token(app): #NOTE: token will last for 1 hour
     print("Go to", flow["verification_uri"], "and enter code:", flow["user_code"])
     result = app.acquire_token_by_device_flow(flow)
     if "access_token" in result:
-        return result["access_token"]
+        return result
 
     raise RuntimeError("Authentication failed: {}".format(result.get("error_description")))
 
 
+def get_token(app): #NOTE: token will last for 1 hour
+    return acquire_token_result(app)["access_token"]
+
+
+class TokenProvider:
+    """
+    Long-lived holder of the MSAL app and the current access token.
+
+    The access token is served from memory until shortly before it expires.
+    The token cache file is re-read whenever it changed on disk before MSAL
+    is asked for a new token (another process may have signed in), and
+    merged with the file when written back, which only happens when MSAL
+    reports a change. Safe to share across threads.
+    """
+
+    def __init__(self, cache_file=CACHE_FILE, refresh_margin_seconds=300):
+        self.cache_file = cache_file
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._lock = threading.RLock()
+        self._cache = SerializableTokenCache()
+        self._cache_signature = None
+        self._msal_app = None
+        self._access_token = None
+        self._expires_at = 0.0
+        self._pending_flow = None  # device flow started from the web UI
+        with self._lock:
+            self._reload_cache_locked()
+        atexit.register(self.persist)
+
+    @property
+    def msal_app(self):
+        # created lazily: building the app does an authority discovery call
+        if self._msal_app is None:
+            with self._lock:
+                if self._msal_app is None:
+                    self._msal_app = PublicClientApplication(
+                        client_id=CLIENT_ID,
+                        authority=AUTHORITY,
+                        token_cache=self._cache,
+                    )
+        return self._msal_app
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._access_token is not None
+            and time.time() < self._expires_at - self.refresh_margin_seconds
+        )
+
+    def get_access_token(self, interactive=False):
+        """
+        Return a valid access token, refreshing it through MSAL only when the
+        in-memory one is missing or about to expire. Returns None when MSAL
+        has no usable refresh token, unless interactive=True (command-line
+        scripts only): then a device flow is run, printing its code to the
+        console. The flow runs without holding the lock, so other callers
+        are not stuck behind it.
+        """
+        if self._is_fresh():
+            return self._access_token
+
+        with self._lock:
+            if self._is_fresh():
+                return self._access_token
+            self._reload_cache_locked()
+            result = acquire_token_result(self.msal_app, interactive=False)
+            if result:
+                return self._store_locked(result)
+        if not interactive:
+            return None
+
+        result = acquire_token_result(self.msal_app, interactive=True)
+        with self._lock:
+            return self._store_locked(result)
+
+    def _store_locked(self, result):
+        self._access_token = result["access_token"]
+        self._expires_at = time.time() + int(result.get("expires_in", 0))
+        self._persist_locked()
+        return self._access_token
+
+    def start_device_flow(self):
+        """
+        Start a device flow for the web UI (Page 1) and finish it in a
+        background thread, which stores the token once the user has entered
+        the code. While a flow is pending the same one is returned. Returns
+        MSAL's flow dict; it has no "user_code" if the flow could not start.
+        """
+        with self._lock:
+            flow = self._pending_flow
+            if flow is not None and time.time() < flow.get("expires_at", 0):
+                return flow
+            flow = self.msal_app.initiate_device_flow(scopes=SCOPES)
+            if "user_code" not in flow:
+                return flow
+            self._pending_flow = flow
+        threading.Thread(target=self._complete_device_flow, args=(flow,), daemon=True).start()
+        return flow
+
+    def _complete_device_flow(self, flow):
+        try:
+            # polls until the code is entered or the flow expires
+            result = self.msal_app.acquire_token_by_device_flow(flow)
+        except Exception as e:
+            result = {"error_description": str(e)}
+        with self._lock:
+            if self._pending_flow is flow:
+                self._pending_flow = None
+            if "access_token" in result:
+                self._store_locked(result)
+                return
+        print(f"Device flow sign-in did not complete: {result.get('error_description')}")
+
+    def get_headers(self):
+        """Authorization header for Graph; raises GraphAuthError instead of prompting."""
+        access_token = self.get_access_token()
+        if not access_token:
+            raise GraphAuthError("No Microsoft Graph access token. Please authorize on Page 1 first.")
+        return {"Authorization": f"Bearer {access_token}"}
+
+    def persist(self):
+        with self._lock:
+            self._persist_locked()
+
+    def _cache_file_signature(self):
+        try:
+            st = os.stat(self.cache_file)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _reload_cache_locked(self):
+        signature = self._cache_file_signature()
+        if signature is None or signature == self._cache_signature:
+            return
+        with open(self.cache_file, "r") as f:
+            on_disk = f.read()
+        changed = self._cache.has_state_changed  # serialize() resets it
+        self._cache.deserialize(merge_cache_states(self._cache.serialize(), on_disk))
+        self._cache.has_state_changed = changed
+        self._cache_signature = signature
+
+    def _persist_locked(self):
+        if not self._cache.has_state_changed:
+            return
+        state = self._cache.serialize()
+        if self._cache_file_signature() not in (None, self._cache_signature):
+            # written by another process since we last read it: keep its tokens too
+            with open(self.cache_file, "r") as f:
+                state = merge_cache_states(f.read(), state)
+            self._cache.deserialize(state)
+        cache_dir = os.path.dirname(self.cache_file) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(state)
+        os.replace(tmp_path, self.cache_file)
+        self._cache_signature = self._cache_file_signature()
+        self._cache.has_state_changed = False
+
+
 
 if __name__ == "__main__":
     print("Microsoft Graph API Test")
@@ -0,0 +1,218 @@
+# graph_client.py
+import os
+import time
+import base64
+import random
+import asyncio
+import contextlib
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+import async_io
+
+GRAPH_BASE_URL = os.getenv("GRAPH_BASE_URL") or "https://graph.microsoft.com/v1.0"
+
+GRAPH_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+GRAPH_MAX_RETRIES = int(os.getenv("GRAPH_MAX_RETRIES") or 5)
+GRAPH_MAX_CONCURRENCY = int(os.getenv("GRAPH_MAX_CONCURRENCY") or 16)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 60.0
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def parse_retry_after(value):
+    """Retry-After is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that halves when Graph throttles us and creeps back up
+    by about one slot per window of successful requests (AIMD). A Retry-After
+    from the server also pauses every new request until it has passed.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._changed = None  # created on the event loop
+
+    async def acquire(self):
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        while self.in_flight >= int(self.limit):
+            self._changed.clear()
+            await self._changed.wait()
+        self.in_flight += 1
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            try:
+                await asyncio.sleep(pause)
+            except BaseException:
+                self.release()
+                raise
+
+    def release(self):
+        # synchronous, so a cancelled request can never keep its slot
+        self.in_flight -= 1
+        self._changed.set()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttled(self, retry_after=None):
+        self.limit = max(self.minimum, self.limit / 2)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+
+class GraphClient:
+    """
+    The one way the app and scripts talk to Microsoft Graph: builds URLs and
+    auth headers, sends requests over the shared pooled connection
+    (async_io), applies timeouts, retries transient failures with jittered
+    backoff, honours Retry-After and adapts its concurrency when throttled.
+
+    Coroutines (a*) must run on the async_io loop; the plain methods are
+    blocking wrappers for synchronous callers.
+    """
+
+    def __init__(self, get_headers, base_url: str = GRAPH_BASE_URL,
+                 max_retries: int = GRAPH_MAX_RETRIES, max_concurrency: int = GRAPH_MAX_CONCURRENCY):
+        self.get_headers = get_headers
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.limiter = AdaptiveLimiter(max_concurrency)
+
+    def url(self, path: str) -> str:
+        # nextLink/deltaLink values are already absolute
+        return path if path.startswith("http") else self.base_url + path
+
+    async def _headers(self, extra=None):
+        # token refreshes can block on MSAL, so keep them off the event loop
+        headers = dict(await asyncio.to_thread(self.get_headers))
+        headers.update(extra or {})
+        return headers
+
+    @contextlib.asynccontextmanager
+    async def astream(self, method: str, path: str, headers=None):
+        """
+        Send a request and yield the response with its body not read yet.
+        Retries happen before the body is handed over; errors while reading
+        the body are left to the caller (e.g. to resume with Range).
+        """
+        url = self.url(path)
+        client = async_io.get_client()
+        for attempt in range(self.max_retries + 1):
+            request = client.build_request(
+                method, url, headers=await self._headers(headers), timeout=GRAPH_TIMEOUT
+            )
+            await self.limiter.acquire()
+            try:
+                response = await client.send(request, stream=True)
+            except httpx.TransportError:
+                self.limiter.release()
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            except BaseException:
+                # cancelled (e.g. a sibling fetch failed) while waiting for the response
+                self.limiter.release()
+                raise
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code in THROTTLE_STATUSES:
+                    self.limiter.on_throttled(retry_after)
+                self.limiter.release()
+                await response.aclose()
+                await asyncio.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
+                continue
+
+            if response.status_code < 400:
+                self.limiter.on_success()
+            try:
+                yield response
+            finally:
+                self.limiter.release()
+                await response.aclose()
+            return
+
+    async def arequest(self, method: str, path: str, headers=None) -> httpx.Response:
+        """
+        Send a request and read its whole body. A connection dropped while
+        reading the body (e.g. halfway through a large download) is retried
+        from the start, with the same backoff.
+        """
+        for attempt in range(self.max_retries + 1):
+            async with self.astream(method, path, headers) as response:
+                try:
+                    await response.aread()
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                else:
+                    return response
+            await asyncio.sleep(backoff_delay(attempt))
+
+    async def aget_json(self, path: str):
+        response = await self.arequest("GET", path)
+        response.raise_for_status()
+        return response.json()
+
+    def get_json(self, path: str):
+        return async_io.run(self.aget_json(path))
+
+    def iter_pages(self, path: str):
+        """
+        Lazily yield each page (the decoded JSON body) of a Graph collection,
+        following @odata.nextLink. Nothing past the current page is fetched
+        until the caller asks for it.
+        """
+        while path:
+            page = self.get_json(path)
+            yield page
+            path = page.get("@odata.nextLink")
+
+    def iter_items(self, path: str):
+        for page in self.iter_pages(path):
+            yield from page.get("value", [])
+
+    def encode_cursor(self, next_link):
+        if not next_link:
+            return None
+        return base64.urlsafe_b64encode(next_link.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, cursor: str) -> str:
+        """
+        Turn a cursor handed out by encode_cursor back into a nextLink. Only
+        Graph URLs are accepted, since the request is sent with our bearer token.
+        """
+        try:
+            url = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        except Exception:
+            raise ValueError("Invalid cursor")
+        if not url.startswith(self.base_url + "/"):
+            raise ValueError("Invalid cursor")
+        return url
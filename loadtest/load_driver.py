@@ -0,0 +1,276 @@
+# loadtest/load_driver.py
+"""
+Load driver for a running app (normally loadtest/run_app.py). Workers send a
+weighted mix of synthetic requests, or replay recorded ones, for a fixed
+time and report latency percentiles and throughput per operation.
+
+    python loadtest/load_driver.py --base-url http://127.0.0.1:5050 --workers 16 --duration 60
+    python loadtest/load_driver.py --mix search=70,chat=20,summarize=10 --record traffic.jsonl
+    python loadtest/load_driver.py --replay traffic.jsonl --output results.json
+
+A recorded request is one JSON object per line:
+    {"op": "search", "method": "GET", "path": "/api/search", "params": {"q": "spark"}}
+Paths may contain {thread_id}, filled with one of the driver's threads.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime
+
+import httpx
+
+DEFAULT_MIX = {
+    "search": 35,
+    "suggest": 15,
+    "chat": 15,
+    "chat_stream": 5,
+    "summarize": 5,
+    "threads_list": 10,
+    "thread_get": 10,
+    "thread_create": 5,
+}
+
+QUERY_WORDS = (
+    "aws azure spark databricks sql python cluster pipeline neural network "
+    "machine learning deep model training regression embedding transformer "
+    "storage query index join stream github deploy docker lecture exam project"
+).split()
+
+
+def parse_mix(text: str):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown operation in --mix: {name} (known: {', '.join(DEFAULT_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, pct: float):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class TrafficGenerator:
+    """Synthetic requests drawn from a weighted mix of operations."""
+
+    def __init__(self, mix, note_ids, seed: int):
+        self.ops = list(mix)
+        self.weights = [mix[op] for op in self.ops]
+        self.note_ids = note_ids or []
+        self.rng = random.Random(seed)
+
+    def query(self):
+        return " ".join(self.rng.sample(QUERY_WORDS, self.rng.choice((1, 1, 2))))
+
+    def notes(self, count):
+        if not self.note_ids:
+            return []
+        return self.rng.sample(self.note_ids, min(count, len(self.note_ids)))
+
+    def next(self):
+        op = self.rng.choices(self.ops, self.weights)[0]
+        if op == "search":
+            return {"op": op, "method": "GET", "path": "/api/search", "params": {"q": self.query()}}
+        if op == "suggest":
+            word = self.rng.choice(QUERY_WORDS)
+            return {"op": op, "method": "GET", "path": "/api/suggest",
+                    "params": {"prefix": word[:self.rng.randint(1, len(word))]}}
+        if op in ("chat", "chat_stream"):
+            body = {"message": f"What do my notes say about {self.query()}?", "note_ids": self.notes(2),
+                    "thread_id": "{thread_id}"}
+            path = "/api/chat/stream" if op == "chat_stream" else "/api/chat"
+            return {"op": op, "method": "POST", "path": path, "json": body}
+        if op == "summarize":
+            return {"op": op, "method": "POST", "path": "/api/summarize", "json": {"ids": self.notes(3)}}
+        if op == "threads_list":
+            return {"op": op, "method": "GET", "path": "/api/threads"}
+        if op == "thread_get":
+            return {"op": op, "method": "GET", "path": "/api/threads/{thread_id}"}
+        return {"op": op, "method": "POST", "path": "/api/threads", "json": {"title": "Load test thread"}}
+
+
+class ReplayTraffic:
+    """Recorded requests, handed out in order and repeated when exhausted."""
+
+    def __init__(self, path):
+        with open(path, "r") as f:
+            self.requests = [json.loads(line) for line in f if line.strip()]
+        if not self.requests:
+            raise SystemExit(f"No requests in {path}")
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def next(self):
+        with self._lock:
+            request = self.requests[self._next % len(self.requests)]
+            self._next += 1
+            return request
+
+
+def fill_thread_id(value, thread_id):
+    if isinstance(value, str):
+        return value.replace("{thread_id}", thread_id)
+    if isinstance(value, dict):
+        return {key: fill_thread_id(item, thread_id) for key, item in value.items()}
+    return value
+
+
+class LoadRun:
+    def __init__(self, base_url, workers, duration, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.workers = workers
+        self.duration = duration
+        self.timeout = timeout
+        self.samples = []  # (op, seconds, ok, bytes)
+        self.thread_ids = []
+        self._lock = threading.Lock()
+
+    def setup(self, threads: int = 5):
+        """Sync the notes catalog from the stub drive, collect note ids and create a few threads."""
+        with httpx.Client(base_url=self.base_url, timeout=self.timeout) as client:
+            client.post("/api/reload-notes")
+            notes = client.get("/api/notes-metadata").json()
+            for _ in range(threads):
+                response = client.post("/api/threads", json={"title": "Load test thread"})
+                if response.status_code == 201:
+                    self.thread_ids.append(response.json()["id"])
+        return [note["id"] for note in notes if note.get("id")]
+
+    def send(self, client, request, rng):
+        thread_id = rng.choice(self.thread_ids) if self.thread_ids else "000000000000000000000000"
+        path = fill_thread_id(request["path"], thread_id)
+        body = fill_thread_id(request.get("json"), thread_id)
+        keep_body = request["op"] == "thread_create"
+        chunks = []
+        size = 0
+        start = time.perf_counter()
+        try:
+            with client.stream(request["method"], path, params=request.get("params"), json=body) as response:
+                for chunk in response.iter_bytes():
+                    size += len(chunk)
+                    if keep_body:
+                        chunks.append(chunk)
+                ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        elapsed = time.perf_counter() - start
+
+        if ok and keep_body:
+            # new threads join the pool used by thread_get / chat
+            thread = json.loads(b"".join(chunks))
+            with self._lock:
+                self.thread_ids.append(thread["id"])
+        return elapsed, ok, size
+
+    def worker(self, traffic, seed, deadline, record):
+        rng = random.Random(seed)
+        with httpx.Client(base_url=self.base_url, timeout=self.timeout) as client:
+            while time.monotonic() < deadline:
+                request = traffic.next()
+                elapsed, ok, size = self.send(client, request, rng)
+                with self._lock:
+                    self.samples.append((request["op"], elapsed, ok, size))
+                    if record is not None:
+                        record.write(json.dumps(request) + "\n")
+
+    def run(self, make_traffic, record_path=None):
+        record = open(record_path, "w") if record_path else None
+        deadline = time.monotonic() + self.duration
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=self.worker, args=(make_traffic(i), i, deadline, record), daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        if record:
+            record.close()
+        return self.report(wall)
+
+    def report(self, wall):
+        by_op = {}
+        for op, elapsed, ok, size in self.samples:
+            by_op.setdefault(op, []).append((elapsed, ok, size))
+
+        def summarize(samples):
+            latencies = sorted(elapsed for elapsed, _, _ in samples)
+            errors = sum(1 for _, ok, _ in samples if not ok)
+            return {
+                "requests": len(samples),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+                "throughput_rps": round(len(samples) / wall, 2) if wall else None,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+                "max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+                "bytes_received": sum(size for _, _, size in samples),
+            }
+
+        all_samples = [(elapsed, ok, size) for _, elapsed, ok, size in self.samples]
+        return {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "base_url": self.base_url,
+            "workers": self.workers,
+            "duration_s": round(wall, 2),
+            "total": summarize(all_samples),
+            "operations": {op: summarize(samples) for op, samples in sorted(by_op.items())},
+        }
+
+
+def print_report(report):
+    header = f"{'operation':<16}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["operations"].items()) + [("TOTAL", report["total"])]
+    for op, stats in rows:
+        print(f"{op:<16}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput_rps'] or 0:>10.1f}"
+              f"{stats['p50_ms'] or 0:>10.1f}{stats['p95_ms'] or 0:>10.1f}{stats['p99_ms'] or 0:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive load against the app and report latency percentiles.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5050")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent client threads.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds.")
+    parser.add_argument("--mix", help="Weighted operations, e.g. search=60,chat=30,summarize=10.")
+    parser.add_argument("--replay", help="Replay requests from a JSON-lines file instead of the synthetic mix.")
+    parser.add_argument("--record", help="Also write every request sent to this JSON-lines file.")
+    parser.add_argument("--output", help="Write the report as JSON to this file.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run = LoadRun(args.base_url, args.workers, args.duration, args.timeout)
+    note_ids = run.setup()
+
+    if args.replay:
+        replay = ReplayTraffic(args.replay)
+        make_traffic = lambda i: replay  # noqa: E731 (one shared, ordered stream)
+    else:
+        mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+        make_traffic = lambda i: TrafficGenerator(mix, note_ids, args.seed + i)  # noqa: E731
+
+    report = run.run(make_traffic, args.record)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote report to {args.output}")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
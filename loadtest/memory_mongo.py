@@ -0,0 +1,204 @@
+# loadtest/memory_mongo.py
+"""
+In-memory stand-in for the small part of pymongo the app uses (ThreadStore):
+insert_one, find/find_one with sort/limit/projection, update_one with upsert,
+find_one_and_update, delete_one/delete_many and create_index (unique indexes
+are enforced). Filters support equality, $or, $exists, $in, $lt/$lte/$gt/$gte.
+
+Not a database: everything is a list scan under one lock. It is only meant
+to take Mongo out of the picture when load-testing the app.
+"""
+import copy
+import threading
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+_MISSING = object()
+
+COMPARISONS = {
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+}
+
+
+def matches(doc, flt) -> bool:
+    for key, cond in flt.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = doc.get(key, _MISSING)
+        if isinstance(cond, dict) and cond and all(op.startswith("$") for op in cond):
+            for op, arg in cond.items():
+                if op == "$exists":
+                    if (value is not _MISSING) != bool(arg):
+                        return False
+                elif op == "$in":
+                    if (None if value is _MISSING else value) not in arg:
+                        return False
+                elif op in COMPARISONS:
+                    if value is _MISSING or value is None or not COMPARISONS[op](value, arg):
+                        return False
+                else:
+                    raise NotImplementedError(f"Unsupported operator {op}")
+        elif (None if value is _MISSING else value) != cond:
+            return False
+    return True
+
+
+def project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = [key for key, flag in projection.items() if flag and key != "_id"]
+    if include:
+        out = {key: doc[key] for key in include if key in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+    else:
+        out = {key: value for key, value in doc.items() if projection.get(key, 1)}
+    return copy.deepcopy(out)
+
+
+class Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key_or_list, direction=1):
+        keys = key_or_list if isinstance(key_or_list, list) else [(key_or_list, direction)]
+        for key, order in reversed(keys):
+            # missing values sort first in ascending order, like Mongo's null
+            self._docs.sort(key=lambda d: (key in d, d.get(key)), reverse=order < 0)
+        return self
+
+    def limit(self, count):
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+
+class Collection:
+    def __init__(self, lock):
+        self._lock = lock
+        self._docs = []
+        self._unique = []  # lists of field names
+
+    def create_index(self, keys, unique=False, **kwargs):
+        fields = [key for key, _ in keys] if isinstance(keys, list) else [keys]
+        if unique and fields not in self._unique:
+            self._unique.append(fields)
+        return "_".join(fields)
+
+    def _check_unique(self, doc, ignore=None):
+        for fields in self._unique:
+            key = tuple(doc.get(f) for f in fields)
+            for other in self._docs:
+                if other is not ignore and tuple(other.get(f) for f in fields) == key:
+                    raise DuplicateKeyError(f"Duplicate key {dict(zip(fields, key))}")
+
+    def insert_one(self, doc):
+        with self._lock:
+            doc.setdefault("_id", ObjectId())
+            stored = copy.deepcopy(doc)
+            self._check_unique(stored)
+            self._docs.append(stored)
+            return SimpleNamespace(inserted_id=doc["_id"], acknowledged=True)
+
+    def find(self, flt=None, projection=None):
+        with self._lock:
+            return Cursor([project(d, projection) for d in self._docs if matches(d, flt or {})])
+
+    def find_one(self, flt=None, projection=None):
+        with self._lock:
+            for doc in self._docs:
+                if matches(doc, flt or {}):
+                    return project(doc, projection)
+            return None
+
+    @staticmethod
+    def _apply(doc, update, inserting):
+        for key, value in update.get("$set", {}).items():
+            doc[key] = copy.deepcopy(value)
+        for key in update.get("$unset", {}):
+            doc.pop(key, None)
+        for key, value in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+        for key, value in update.get("$push", {}).items():
+            doc.setdefault(key, []).append(copy.deepcopy(value))
+        if inserting:
+            for key, value in update.get("$setOnInsert", {}).items():
+                doc[key] = copy.deepcopy(value)
+
+    def _update(self, flt, update, upsert):
+        for doc in self._docs:
+            if matches(doc, flt):
+                self._apply(doc, update, False)
+                return doc, False
+        if upsert:
+            doc = {key: value for key, value in flt.items() if not key.startswith("$") and not isinstance(value, dict)}
+            doc.setdefault("_id", ObjectId())
+            self._apply(doc, update, True)
+            self._check_unique(doc)
+            self._docs.append(doc)
+            return doc, True
+        return None, False
+
+    def update_one(self, flt, update, upsert=False):
+        with self._lock:
+            doc, inserted = self._update(flt, update, upsert)
+            return SimpleNamespace(
+                matched_count=1 if doc is not None and not inserted else 0,
+                modified_count=1 if doc is not None and not inserted else 0,
+                upserted_id=doc["_id"] if inserted else None,
+            )
+
+    def find_one_and_update(self, flt, update, projection=None, return_document=False, upsert=False):
+        with self._lock:
+            before = None
+            for doc in self._docs:
+                if matches(doc, flt):
+                    before = project(doc, projection)
+                    break
+            doc, _ = self._update(flt, update, upsert)
+            if doc is None:
+                return None
+            # ReturnDocument.AFTER is True, BEFORE is False
+            return project(doc, projection) if return_document else before
+
+    def delete_one(self, flt):
+        with self._lock:
+            for i, doc in enumerate(self._docs):
+                if matches(doc, flt):
+                    del self._docs[i]
+                    return SimpleNamespace(deleted_count=1)
+            return SimpleNamespace(deleted_count=0)
+
+    def delete_many(self, flt):
+        with self._lock:
+            before = len(self._docs)
+            self._docs = [doc for doc in self._docs if not matches(doc, flt)]
+            return SimpleNamespace(deleted_count=before - len(self._docs))
+
+    def count_documents(self, flt):
+        with self._lock:
+            return sum(1 for doc in self._docs if matches(doc, flt))
+
+
+class MemoryDatabase:
+    """db["name"] returns the same in-memory collection every time."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._collections = {}
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = Collection(self._lock)
+            return self._collections[name]
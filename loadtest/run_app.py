@@ -0,0 +1,90 @@
+# loadtest/run_app.py
+"""
+Run app_backend.py against the stubs instead of the real services: Graph
+and Perplexity point at stub_servers.py (started in-process with
+--start-stubs, or given by URL), threads live in the in-memory Mongo
+stand-in, the Graph token is a dummy, and every file the app writes
+(metadata, delta state, caches, profiles) goes to a temporary directory.
+
+    python loadtest/run_app.py --start-stubs --port 5050
+    python loadtest/run_app.py --graph-base-url http://127.0.0.1:8001/v1.0 \
+        --perplexity-base-url http://127.0.0.1:8002
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(LOADTEST_DIR))
+sys.path.insert(0, LOADTEST_DIR)
+
+from memory_mongo import MemoryDatabase  # noqa: E402
+from stub_servers import add_stub_arguments, start_stub_servers, stub_config_from_args  # noqa: E402
+
+
+def configure_environment(graph_base_url, perplexity_base_url, work_dir):
+    """Must run before app_backend is imported: it reads these at import."""
+    os.environ.update(
+        {
+            "GRAPH_BASE_URL": graph_base_url,
+            "PERPLEXITY_BASE_URL": perplexity_base_url,
+            "PERPLEXITY_API_KEY": "loadtest",
+            "ONEDRIVE_DOCUMENTS_FOLDER_ID": "stub-drive",
+            "MONGO_URL": "",
+            "NOTES_METADATA_PATH": os.path.join(work_dir, "notes_metadata.json"),
+            "NOTES_DELTA_STATE_PATH": os.path.join(work_dir, "notes_delta.json"),
+            "NOTE_FILES_DIR": os.path.join(work_dir, "note_files"),
+            "DOCUMENT_CACHE_DIR": os.path.join(work_dir, "document_cache"),
+            "TEXT_CACHE_DIR": os.path.join(work_dir, "text_cache"),
+            "SUMMARY_CACHE_PATH": os.path.join(work_dir, "summary_cache.json"),
+            "PROFILE_DIR": os.path.join(work_dir, "profiles"),
+        }
+    )
+
+
+def load_app():
+    import app_backend
+    from thread_store import ThreadStore
+
+    # a token that never expires, so MSAL is never asked for one
+    app_backend.TOKEN_PROVIDER._access_token = "loadtest-token"
+    app_backend.TOKEN_PROVIDER._expires_at = time.time() + 10 * 365 * 24 * 3600
+
+    app_backend.THREAD_STORE = ThreadStore(MemoryDatabase())
+    app_backend.prepare_thread_store()
+    return app_backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the app against local stubs for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--start-stubs", action="store_true", help="Start the Graph/Perplexity stubs in this process.")
+    parser.add_argument("--graph-base-url", default="http://127.0.0.1:8001/v1.0")
+    parser.add_argument("--perplexity-base-url", default="http://127.0.0.1:8002")
+    parser.add_argument("--work-dir", help="Where the app writes its files (default: a new temp dir).")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    graph_base_url = args.graph_base_url
+    perplexity_base_url = args.perplexity_base_url
+    if args.start_stubs:
+        graph, pplx, _ = start_stub_servers(stub_config_from_args(args))
+        graph_base_url = f"http://127.0.0.1:{graph.server_address[1]}/v1.0"
+        perplexity_base_url = f"http://127.0.0.1:{pplx.server_address[1]}"
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="notes-loadtest-")
+    configure_environment(graph_base_url, perplexity_base_url, work_dir)
+    app_backend = load_app()
+
+    # one access-log line per request would dominate the run
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    print(f"Graph: {graph_base_url}  Perplexity: {perplexity_base_url}  files: {work_dir}")
+    app_backend.app.run(host=args.host, port=args.port, threaded=True, debug=False)
+
+
+if __name__ == "__main__":
+    main()
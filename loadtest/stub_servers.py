@@ -0,0 +1,319 @@
+# loadtest/stub_servers.py
+"""
+Local stand-ins for Microsoft Graph and the Perplexity API, for load tests.
+
+Graph (the endpoints the app uses, under /v1.0):
+    GET /me/drive/root/search(q='...')      paged with $top / $skiptoken
+    GET /me/drive/root/delta                paged, ends with a deltaLink
+    GET /drives/{drive}/items/{id}          metadata (eTag, cTag)
+    GET /drives/{drive}/items/{id}/content  a generated .docx
+Perplexity:
+    POST /chat/completions                  JSON, or SSE when "stream": true
+
+Latency, payload sizes and the error rate are configurable; injected errors
+are 429/503 with Retry-After: 0, like real throttling.
+
+    python loadtest/stub_servers.py --graph-port 8001 --pplx-port 8002 --latency-ms 80 --error-rate 0.01
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import zipfile
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import fixtures  # noqa: E402  (note names and words shared with the benchmarks)
+
+DOCX_VARIANTS = 16  # distinct generated documents, shared by all notes
+WORD_XML_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+SEARCH_PATH_RE = re.compile(r"^/v1\.0/me/drive/root/search\(q='(.*)'\)$")
+ITEM_PATH_RE = re.compile(r"^/v1\.0/drives/([^/]+)/items/([^/]+)(/content)?$")
+
+
+class StubConfig:
+    def __init__(self, latency_ms=50.0, jitter_ms=20.0, error_rate=0.0, notes=1000,
+                 doc_bytes=64 * 1024, reply_words=150, stream_chunk_words=5,
+                 stream_delay_ms=10.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.notes = notes
+        self.doc_bytes = doc_bytes
+        self.reply_words = reply_words
+        self.stream_chunk_words = stream_chunk_words
+        self.stream_delay_ms = stream_delay_ms
+        self.seed = seed
+
+
+def make_notes(count: int, seed: int = 0):
+    """The benchmark notes, with the drive item fields the app reads."""
+    notes = fixtures.make_notes(count, seed, id_prefix="STUB")
+    for i, note in enumerate(notes):
+        note.update(
+            {
+                "eTag": f'"{{STUB{i:08d}}},1"',
+                "cTag": f'"c:{{STUB{i:08d}}},1"',
+                "size": 0,
+                "file": {"mimeType": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"},
+            }
+        )
+    return notes
+
+
+def make_docx(size: int, rng: random.Random) -> bytes:
+    """A minimal .docx of about `size` bytes (stored, not compressed)."""
+    paragraphs = []
+    total = 0
+    while total < size:
+        text = " ".join(rng.choice(fixtures.VOCABULARY) for _ in range(60))
+        paragraphs.append(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>")
+        total += len(paragraphs[-1])
+    xml = (
+        f'<?xml version="1.0" encoding="UTF-8"?><w:document xmlns:w="{WORD_XML_NS}">'
+        f"<w:body>{''.join(paragraphs)}</w:body></w:document>"
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as docx:
+        docx.writestr("word/document.xml", xml)
+    return buffer.getvalue()
+
+
+class StubState:
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self.notes = make_notes(config.notes, config.seed)
+        self.notes_by_id = {note["id"]: note for note in self.notes}
+        rng = random.Random(config.seed)
+        self.docx_variants = [make_docx(config.doc_bytes, rng) for _ in range(DOCX_VARIANTS)]
+        self._rng = random.Random(config.seed + 1)
+        self._rng_lock = threading.Lock()
+        self.requests = 0
+        self.errors_injected = 0
+
+    def random(self):
+        with self._rng_lock:
+            return self._rng.random()
+
+    def sleep_latency(self):
+        config = self.config
+        delay = config.latency_ms + (self.random() * 2 - 1) * config.jitter_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def should_fail(self):
+        with self._rng_lock:
+            self.requests += 1
+            fail = bool(self.config.error_rate) and self._rng.random() < self.config.error_rate
+            if fail:
+                self.errors_injected += 1
+            return fail
+
+    def reply_text(self, words: int):
+        with self._rng_lock:
+            return " ".join(self._rng.choice(fixtures.VOCABULARY) for _ in range(words))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set on the subclass built by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_injected_error(self):
+        status = 429 if self.state.random() < 0.5 else 503
+        self.send_json(status, {"error": {"code": "stubInjectedError", "message": "Injected error"}},
+                       {"Retry-After": "0"})
+
+    def base_url(self):
+        return f"http://{self.headers.get('Host')}/v1.0"
+
+
+class GraphHandler(StubHandler):
+    def do_GET(self):
+        self.state.sleep_latency()
+        if self.state.should_fail():
+            return self.send_injected_error()
+
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+        m = SEARCH_PATH_RE.match(path)
+        if m:
+            return self.search(m.group(1).replace("''", "'"), params)
+        if path == "/v1.0/me/drive/root/delta":
+            return self.delta(params)
+        m = ITEM_PATH_RE.match(path)
+        if m:
+            note = self.state.notes_by_id.get(m.group(2))
+            if note is None:
+                return self.send_json(404, {"error": {"code": "itemNotFound", "message": "Item not found"}})
+            if m.group(3):
+                return self.content(note)
+            return self.send_json(200, {k: note[k] for k in ("id", "name", "eTag", "cTag")})
+        self.send_json(404, {"error": {"code": "notSupported", "message": f"Stub has no route for {path}"}})
+
+    def search(self, query, params):
+        terms = query.casefold().split()
+        hits = [
+            note for note in self.state.notes
+            if any(term in note["name"].casefold() for term in terms)
+        ]
+        top = int(params.get("$top") or 50)
+        offset = int(params.get("$skiptoken") or 0)
+        page = hits[offset:offset + top]
+        data = {"value": [{k: note[k] for k in ("id", "name", "webUrl")} for note in page]}
+        if offset + top < len(hits):
+            escaped = query.replace("'", "''")
+            data["@odata.nextLink"] = (
+                f"{self.base_url()}/me/drive/root/search(q='{escaped}')"
+                f"?$top={top}&$skiptoken={offset + top}"
+            )
+        self.send_json(200, data)
+
+    def delta(self, params):
+        if params.get("token") == "latest":
+            return self.send_json(200, {"value": [], "@odata.deltaLink": f"{self.base_url()}/me/drive/root/delta?token=latest"})
+        page_size = 200
+        offset = int(params.get("$skiptoken") or 0)
+        data = {"value": self.state.notes[offset:offset + page_size]}
+        if offset + page_size < len(self.state.notes):
+            data["@odata.nextLink"] = f"{self.base_url()}/me/drive/root/delta?$skiptoken={offset + page_size}"
+        else:
+            data["@odata.deltaLink"] = f"{self.base_url()}/me/drive/root/delta?token=latest"
+        self.send_json(200, data)
+
+    def content(self, note):
+        body = self.state.docx_variants[hash(note["id"]) % DOCX_VARIANTS]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PerplexityHandler(StubHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        self.state.sleep_latency()
+        if self.state.should_fail():
+            return self.send_injected_error()
+        if urlsplit(self.path).path != "/chat/completions":
+            return self.send_json(404, {"error": {"message": f"Stub has no route for {self.path}"}})
+
+        model = payload.get("model", "sonar")
+        citations = [f"https://example.invalid/source/{i}" for i in range(3)]
+        text = self.state.reply_text(self.state.config.reply_words)
+        base = {"id": f"stub-{time.time_ns()}", "created": int(time.time()), "model": model, "citations": citations}
+
+        if not payload.get("stream"):
+            message = {"role": "assistant", "content": text}
+            return self.send_json(200, dict(
+                base,
+                object="chat.completion",
+                choices=[{"index": 0, "message": message, "delta": message, "finish_reason": "stop"}],
+                usage={"prompt_tokens": 0, "completion_tokens": len(text.split()), "total_tokens": len(text.split())},
+            ))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        words = text.split()
+        step = max(1, self.state.config.stream_chunk_words)
+        for i in range(0, len(words), step):
+            delta = {"role": "assistant", "content": " ".join(words[i:i + step]) + " "}
+            chunk = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": delta, "message": delta, "finish_reason": None}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if self.state.config.stream_delay_ms:
+                time.sleep(self.state.config.stream_delay_ms / 1000)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def make_server(handler_cls, state: StubState, host: str, port: int) -> ThreadingHTTPServer:
+    handler = type(handler_cls.__name__, (handler_cls,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_stub_servers(config: StubConfig, host="127.0.0.1", graph_port=0, pplx_port=0):
+    """
+    Start both stubs in daemon threads. Returns (graph_server, pplx_server,
+    state); the Graph base URL is http://host:port/v1.0 of the first server.
+    """
+    state = StubState(config)
+    servers = []
+    for handler_cls, port in ((GraphHandler, graph_port), (PerplexityHandler, pplx_port)):
+        server = make_server(handler_cls, state, host, port)
+        threading.Thread(target=server.serve_forever, name=handler_cls.__name__, daemon=True).start()
+        servers.append(server)
+    return servers[0], servers[1], state
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean added latency per stub response.")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Uniform +/- jitter on the latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of responses that are 429/503.")
+    parser.add_argument("--notes", type=int, default=1000, help="Notes in the stub drive.")
+    parser.add_argument("--doc-bytes", type=int, default=64 * 1024, help="Size of each generated .docx.")
+    parser.add_argument("--reply-words", type=int, default=150, help="Words per LLM reply.")
+    parser.add_argument("--stream-delay-ms", type=float, default=10.0, help="Delay between streamed chunks.")
+
+
+def stub_config_from_args(args) -> StubConfig:
+    return StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        notes=args.notes,
+        doc_bytes=args.doc_bytes,
+        reply_words=args.reply_words,
+        stream_delay_ms=args.stream_delay_ms,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Microsoft Graph and Perplexity servers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--graph-port", type=int, default=8001)
+    parser.add_argument("--pplx-port", type=int, default=8002)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    graph, pplx, _ = start_stub_servers(stub_config_from_args(args), args.host, args.graph_port, args.pplx_port)
+    print(f"GRAPH_BASE_URL=http://{args.host}:{graph.server_address[1]}/v1.0")
+    print(f"PERPLEXITY_BASE_URL=http://{args.host}:{pplx.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# notes_catalog.py
+import os
+import json
+import tempfile
+import threading
+
+# compact the journal into the main file once it holds this many entries
+JOURNAL_COMPACT_THRESHOLD = 1000
+
+
+class NotesCatalog:
+    """
+    In-memory view of notes_metadata.json, indexed by note id and name.
+
+    The file is only re-parsed when its mtime/size changes (e.g. another
+    process ran download_all_notes.py). Single-note additions are appended to
+    a JSON-lines journal next to the file instead of rewriting it, and the
+    journal is folded back in with an atomic write-rename now and then.
+    `version` goes up with every change, made here or found on disk, so
+    callers can tell that their derived state (indexes, caches) is out of
+    date.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_name = {}
+        self._journal_entries = 0
+        self._signature = None
+        self._version = 0
+
+    # --- loading ---
+
+    def _stat_signature(self):
+        signature = []
+        for p in (self.path, self.journal_path):
+            try:
+                st = os.stat(p)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _refresh(self):
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            signature = self._stat_signature()
+            if signature == self._signature:
+                return
+            notes = []
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    notes = json.load(f)
+            journal = []
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, "r") as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            journal.append(json.loads(line))
+                        except ValueError:
+                            break  # torn last line from an interrupted append
+            self._index(notes + journal)
+            self._journal_entries = len(journal)
+            self._signature = signature
+            self._version += 1
+
+    def _index(self, notes):
+        by_id = {}
+        by_name = {}
+        for note in notes:
+            note_id = note.get("id")
+            if not note_id:
+                continue
+            by_id[note_id] = note
+            by_name[note.get("name", "")] = note
+        self._by_id = by_id
+        self._by_name = by_name
+
+    # --- reads ---
+
+    @property
+    def version(self) -> int:
+        self._refresh()
+        return self._version
+
+    def all(self):
+        self._refresh()
+        return list(self._by_id.values())
+
+    def get(self, note_id: str):
+        self._refresh()
+        return self._by_id.get(note_id)
+
+    def get_by_name(self, name: str):
+        self._refresh()
+        return self._by_name.get(name)
+
+    def __contains__(self, note_id):
+        self._refresh()
+        return note_id in self._by_id
+
+    def __len__(self):
+        self._refresh()
+        return len(self._by_id)
+
+    # --- writes ---
+
+    def add_if_missing(self, note) -> bool:
+        """
+        Add one note unless its id is already present. Returns True if added.
+        """
+        with self._lock:
+            self._refresh()
+            if note["id"] in self._by_id:
+                return False
+            with open(self.journal_path, "a") as f:
+                f.write(json.dumps(note) + "\n")
+            self._by_id[note["id"]] = note
+            self._by_name[note.get("name", "")] = note
+            self._journal_entries += 1
+            self._version += 1
+            if self._journal_entries >= JOURNAL_COMPACT_THRESHOLD:
+                self._write_locked(list(self._by_id.values()))
+            else:
+                self._signature = self._stat_signature()
+            return True
+
+    def replace_all(self, notes):
+        with self._lock:
+            self._write_locked(notes)
+
+    def _write_locked(self, notes):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(notes, f, indent=2)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._index(notes)
+        self._journal_entries = 0
+        self._signature = self._stat_signature()
+        self._version += 1
@@ -0,0 +1,219 @@
+# notes_index.py
+import os
+import re
+import json
+import math
+import heapq
+from collections import Counter
+
+from docx_text import extract_docx_text
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# BM25 parameters (standard defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# note titles are short but very descriptive, so their terms count extra
+TITLE_WEIGHT = 3
+
+
+def tokenize(text: str):
+    return TOKEN_RE.findall(text.lower())
+
+
+class NotesIndex:
+    """
+    In-memory inverted index over note contents, ranked with BM25.
+
+    Each build or update makes a new state and swaps it in with a single
+    assignment, so searches never see a half-built index and need no locking.
+    The term counts of every note are kept, so an update only tokenizes the
+    notes that changed.
+    """
+
+    def __init__(self):
+        self._state = None
+
+    @property
+    def ready(self) -> bool:
+        return self._state is not None
+
+    def __len__(self):
+        return len(self._state["docs"]) if self._state else 0
+
+    def build(self, documents):
+        """
+        Build the index from an iterable of (note_metadata, text) pairs.
+        """
+        self._swap_in(*self._analyze(documents))
+
+    def update(self, documents, remove_ids=()):
+        """
+        Add or replace the notes in `documents` ((note_metadata, text) pairs)
+        and drop the ones in `remove_ids`; all other notes are kept as they are.
+        """
+        new_docs, new_terms = self._analyze(documents)
+        state = self._state
+        if state is None:
+            self._swap_in(new_docs, new_terms)
+            return
+        dropped = set(remove_ids) | {doc["id"] for doc in new_docs}
+        kept = [(doc, terms) for doc, terms in zip(state["docs"], state["doc_terms"]) if doc["id"] not in dropped]
+        self._swap_in([doc for doc, _ in kept] + new_docs, [terms for _, terms in kept] + new_terms)
+
+    @staticmethod
+    def _analyze(documents):
+        docs = []
+        doc_terms = []
+        for note, text in documents:
+            docs.append(
+                {
+                    "id": note.get("id"),
+                    "title": note.get("name", "(no name)"),
+                    "url": note.get("webUrl", "#"),
+                }
+            )
+            terms = Counter(tokenize(text))
+            for term in tokenize(note.get("name", "")):
+                terms[term] += TITLE_WEIGHT
+            doc_terms.append(terms)
+        return docs, doc_terms
+
+    def _swap_in(self, docs, doc_terms):
+        postings = {}
+        doc_lengths = []
+        for doc_idx, terms in enumerate(doc_terms):
+            for term, tf in terms.items():
+                postings.setdefault(term, {})[doc_idx] = tf
+            doc_lengths.append(sum(terms.values()))
+
+        n_docs = len(docs)
+        avg_len = (sum(doc_lengths) / n_docs) if n_docs else 0.0
+        idf = {
+            term: math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in postings.items()
+        }
+
+        self._state = {
+            "docs": docs,
+            "doc_terms": doc_terms,
+            "postings": postings,
+            "doc_lengths": doc_lengths,
+            "avg_len": avg_len,
+            "idf": idf,
+            "ids": {doc["id"] for doc in docs},
+        }
+
+    def covers(self, note_id) -> bool:
+        state = self._state
+        return bool(state) and note_id in state["ids"]
+
+    def search(self, query: str, limit: int = 50, offset: int = 0):
+        """The best-ranked hits for `query`, `limit` at a time starting at `offset`."""
+        state = self._state
+        if not state or not query:
+            return []
+
+        postings = state["postings"]
+        idf = state["idf"]
+        doc_lengths = state["doc_lengths"]
+        avg_len = state["avg_len"] or 1.0
+
+        scores = {}
+        for term in set(tokenize(query)):
+            term_postings = postings.get(term)
+            if not term_postings:
+                continue
+            term_idf = idf[term]
+            for doc_idx, tf in term_postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[doc_idx] / avg_len)
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + term_idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        # ties broken by index order, so pages are stable
+        ranked = heapq.nsmallest(offset + limit, scores.items(), key=lambda kv: (-kv[1], kv[0]))[offset:]
+        return [dict(state["docs"][doc_idx], score=round(score, 4)) for doc_idx, score in ranked]
+
+    def frequent_terms(self, limit: int, min_length: int = 3):
+        """
+        The `limit` terms found in the most notes, as (term, note_count)
+        pairs. Very short and purely numeric terms are left out.
+        """
+        state = self._state
+        if not state:
+            return []
+        counts = (
+            (term, len(p)) for term, p in state["postings"].items()
+            if len(term) >= min_length and not term.isdigit()
+        )
+        return heapq.nlargest(limit, counts, key=lambda kv: kv[1])
+
+
+def load_files_manifest(files_dir):
+    """note_files/manifest.json as written by download_all_notes.py: id -> {"version", ...}."""
+    try:
+        with open(os.path.join(files_dir, "manifest.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def note_version(note):
+    return note.get("cTag") or note.get("eTag") or ""
+
+
+def local_document_version(note, files_dir, text_cache=None):
+    """
+    What the indexed entry of a note depends on (its local file or cached
+    text, name and link), or None if there is no local text for it. The
+    index only needs to be updated for notes whose value changed.
+    """
+    path = os.path.join(files_dir, note.get("id") or "")
+    try:
+        st = os.stat(path)
+        source = ("file", st.st_mtime_ns, st.st_size)
+    except OSError:
+        if text_cache is None or not text_cache.contains(note["id"], note_version(note)):
+            return None
+        source = ("text", note_version(note))
+    return source + (note.get("name"), note.get("webUrl"))
+
+
+def iter_local_documents(notes, files_dir, text_cache=None):
+    """
+    Yield (note, text) for notes whose .docx has been downloaded into
+    `files_dir` (named by item id, as download_all_notes.py stores them), or
+    whose extracted text for the current version is in `text_cache` (a
+    DocumentCache keyed by item id and cTag/eTag, filled when a note is
+    attached in chat or summarized). Other notes are skipped. Text extracted
+    from a downloaded file goes into `text_cache` too, under the version the
+    manifest says was downloaded, so it is only extracted once.
+    """
+    manifest = load_files_manifest(files_dir) if text_cache is not None else {}
+    for note in notes:
+        note_id = note.get("id")
+        if not note_id:
+            continue
+        path = os.path.join(files_dir, note_id)
+        version = note_version(note)
+        try:
+            if os.path.exists(path):
+                cacheable = bool(version) and (manifest.get(note_id) or {}).get("version") == version
+                cached = text_cache.get(note_id, version) if cacheable else None
+                if cached is not None:
+                    text = cached.decode("utf-8")
+                else:
+                    text = extract_docx_text(path)
+                    if cacheable:
+                        text_cache.put(note_id, version, text.encode("utf-8"))
+            elif text_cache is not None:
+                cached = text_cache.get(note_id, version)
+                if cached is None:
+                    continue
+                text = cached.decode("utf-8")
+            else:
+                continue
+        except Exception as e:
+            print(f"Skipping {note.get('name', note_id)} in search index: {e}")
+            continue
+        yield note, text
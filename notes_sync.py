@@ -0,0 +1,117 @@
+# notes_sync.py
+import os
+import json
+import tempfile
+import httpx
+
+DELTA_URL = (
+    "/me/drive/root/delta"
+    "?$select=id,name,webUrl,eTag,cTag,size,file,deleted"
+)
+
+# delta has no full-text search, so notes are recognised by file name
+NOTES_NAME_FILTER = (os.getenv("NOTES_NAME_FILTER") or "notes").lower()
+
+NOTE_FIELDS = ("id", "name", "webUrl", "eTag", "cTag", "size")
+
+
+class DeltaResyncRequired(Exception):
+    pass
+
+
+def is_note_item(item) -> bool:
+    name = (item.get("name") or "").lower()
+    return "file" in item and name.endswith(".docx") and NOTES_NAME_FILTER in name
+
+
+def to_note(item):
+    return {field: item[field] for field in NOTE_FIELDS if field in item}
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_json_atomic(path, data, indent=2):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_path, path)
+
+
+def fetch_delta(url, graph):
+    """
+    Follow a delta query to the end. Returns (changed items, new deltaLink).
+    """
+    items = []
+    try:
+        for page in graph.iter_pages(url):
+            items.extend(page.get("value", []))
+            if "@odata.deltaLink" in page:
+                return items, page["@odata.deltaLink"]
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 410:
+            # the saved token expired or the drive was reset on the server side
+            raise DeltaResyncRequired(e.response.text)
+        raise
+    raise RuntimeError("Delta query ended without a deltaLink")
+
+
+def apply_delta(notes, items):
+    """
+    Apply delta items to a list of notes. Returns (new notes, changes) where
+    changes lists the names of added, updated and removed notes.
+    """
+    by_id = {n["id"]: n for n in notes}
+    changes = {"added": [], "updated": [], "removed": []}
+
+    for item in items:
+        item_id = item.get("id")
+        current = by_id.get(item_id)
+        if "deleted" not in item and is_note_item(item):
+            note = to_note(item)
+            if current is None:
+                changes["added"].append(note.get("name"))
+            elif current != note:
+                changes["updated"].append(note.get("name"))
+            by_id[item_id] = note
+        elif current is not None:
+            # deleted, or renamed/moved so it no longer counts as a note
+            changes["removed"].append(current.get("name"))
+            del by_id[item_id]
+
+    return list(by_id.values()), changes
+
+
+def sync_notes_metadata(graph, catalog, state_path):
+    """
+    Bring the notes catalog (notes_metadata.json) up to date using the drive
+    delta API.
+
+    The first run (or a run after the server asks for a resync) enumerates the
+    whole drive once; later runs only receive what changed since the stored
+    deltaLink. Returns (notes, changes).
+    """
+    state = load_json(state_path, {})
+    delta_link = state.get("deltaLink")
+    notes = catalog.all()
+
+    try:
+        if not delta_link:
+            raise DeltaResyncRequired("no saved deltaLink")
+        items, delta_link = fetch_delta(delta_link, graph)
+        notes, changes = apply_delta(notes, items)
+    except DeltaResyncRequired:
+        items, delta_link = fetch_delta(DELTA_URL, graph)
+        # a full enumeration lists every live item, so anything missing is gone
+        live_ids = {i.get("id") for i in items if "deleted" not in i and is_note_item(i)}
+        stale = [{"id": n["id"], "deleted": {}} for n in notes if n.get("id") not in live_ids]
+        notes, changes = apply_delta(notes, items + stale)
+
+    if any(changes.values()) or not os.path.exists(catalog.path):
+        catalog.replace_all(notes)
+    write_json_atomic(state_path, {"deltaLink": delta_link})
+    return notes, changes
@@ -0,0 +1,175 @@
+# profiler.py
+import io
+import os
+import sys
+import hmac
+import json
+import time
+import pstats
+import cProfile
+import hashlib
+import tempfile
+import threading
+from collections import Counter
+
+SIGNATURE_MAX_AGE_SECONDS = 300
+
+
+def sign_request(secret: str, method: str, path: str, timestamp: int = None) -> str:
+    """
+    Value for the X-Profile header that asks the app to profile one request:
+    "<unix time>.<hex HMAC-SHA256 of 'time:METHOD:path'>".
+    """
+    timestamp = int(time.time()) if timestamp is None else int(timestamp)
+    message = f"{timestamp}:{method.upper()}:{path}".encode("utf-8")
+    digest = hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    return f"{timestamp}.{digest}"
+
+
+def verify_signature(secret: str, value: str, method: str, path: str) -> bool:
+    """True if `value` was made by sign_request for this request in the last few minutes."""
+    if not secret or not value:
+        return False
+    timestamp, _, _ = value.partition(".")
+    try:
+        age = time.time() - int(timestamp)
+    except ValueError:
+        return False
+    if abs(age) > SIGNATURE_MAX_AGE_SECONDS:
+        return False
+    return hmac.compare_digest(sign_request(secret, method, path, int(timestamp)), value)
+
+
+def fold_stack(frame) -> str:
+    """A frame and its callers as one "outer;...;inner" line (collapsed-stack format)."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the given threads every `interval` seconds from a
+    background thread. `threads` maps a label to a thread ident; the label
+    becomes the root of each stack. Nothing is traced in between samples, so
+    the profiled threads run at full speed.
+    """
+
+    mode = "sampling"
+
+    def __init__(self, threads, interval: float):
+        self.threads = dict(threads)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            self.samples += 1
+            for label, ident in self.threads.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[f"{label};{fold_stack(frame)}"] += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return {
+            "interval_s": self.interval,
+            "samples": self.samples,
+            "stacks": dict(self.stacks.most_common()),
+        }
+
+
+class DeterministicProfiler:
+    """
+    cProfile over the calling thread only: exact call counts and times, but
+    every function call is slower while it runs.
+    """
+
+    mode = "cprofile"
+
+    def __init__(self, top_functions: int = 100):
+        self.top_functions = top_functions
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.sort_stats("cumulative").print_stats(self.top_functions)
+        return {"total_calls": stats.total_calls, "stats": out.getvalue()}
+
+
+class ProfileStore:
+    """
+    Saved request profiles, one JSON file each, in a directory that keeps
+    only the newest `max_files` (a ring: saving a new one evicts the oldest).
+    """
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def _names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        # names start with a sortable timestamp
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    @staticmethod
+    def new_name(endpoint: str, started_at: float) -> str:
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(started_at))
+        return f"{stamp}-{int(started_at * 1e6) % 1000000:06d}-{endpoint}.json"
+
+    def save(self, name: str, profile):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(profile, f)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+            names = self._names()
+            for old in names[:max(0, len(names) - self.max_files)]:
+                try:
+                    os.remove(os.path.join(self.directory, old))
+                except OSError:
+                    pass
+
+    def list(self):
+        """Metadata of the saved profiles, newest first (without the profile data)."""
+        with self._lock:
+            names = self._names()
+        entries = []
+        for name in reversed(names):
+            path = os.path.join(self.directory, name)
+            try:
+                size = os.path.getsize(path)
+                with open(path, "r") as f:
+                    profile = json.load(f)
+            except (OSError, ValueError):
+                continue  # evicted meanwhile
+            profile.pop("profile", None)
+            profile.update(name=name, size_bytes=size)
+            entries.append(profile)
+        return entries
+
+    def path(self, name: str):
+        """Path of a saved profile, or None if there is no such profile."""
+        with self._lock:
+            return os.path.join(self.directory, name) if name in self._names() else None
@@ -0,0 +1,71 @@
+# search_cache.py
+import time
+import threading
+from collections import OrderedDict
+
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace differences do not change search results."""
+    return " ".join(query.casefold().split())
+
+
+class SearchCache:
+    """
+    In-process LRU cache of search responses with a TTL, keyed by the
+    normalized query plus paging arguments. Meant to be cleared whenever the
+    notes catalog or search index changes; the TTL bounds staleness for
+    changes made elsewhere (e.g. notes edited in OneDrive). `generation`
+    counts clears, so a response computed before a clear is not stored after it.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    @staticmethod
+    def key(query: str, top: int, cursor=None):
+        return (normalize_query(query), top, cursor)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
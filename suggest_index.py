@@ -0,0 +1,78 @@
+# suggest_index.py
+import heapq
+from bisect import bisect_left
+
+
+class PrefixTable:
+    """
+    Sorted array of (key, weight, payload) searched with binary search: the
+    entries for a prefix are one contiguous slice, from which the heaviest
+    are picked (or simply the first ones, in key order, when unranked).
+    """
+
+    def __init__(self, entries=()):
+        entries = sorted(entries, key=lambda entry: entry[0])
+        self.keys = [entry[0] for entry in entries]
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix: str, limit: int, ranked: bool = True):
+        start = bisect_left(self.keys, prefix)
+        if not ranked:
+            return [entry for entry in self.entries[start:start + limit] if entry[0].startswith(prefix)]
+        # the matching slice ends before the first key >= prefix + max char
+        end = bisect_left(self.keys, prefix + "\U0010ffff", lo=start)
+        return heapq.nlargest(limit, self.entries[start:end], key=lambda entry: entry[1])
+
+
+class SuggestIndex:
+    """
+    Typeahead suggestions for the search box: note names (matched at the
+    start of any word of the name) and the most frequent content terms of
+    the local search index (ranked by how many notes contain them). The two
+    tables are rebuilt separately and swapped in with a single assignment,
+    so a metadata reload only re-sorts the names.
+    """
+
+    def __init__(self):
+        self._names = PrefixTable()
+        self._terms = PrefixTable()
+
+    def set_notes(self, notes):
+        entries = []
+        for note in notes:
+            name = note.get("name") or ""
+            title = name[:-5] if name.lower().endswith(".docx") else name
+            words = title.casefold().split()
+            for i in range(len(words)):
+                entries.append((" ".join(words[i:]), 0, {"id": note.get("id"), "name": name, "title": title}))
+        self._names = PrefixTable(entries)
+
+    def set_terms(self, term_counts):
+        self._terms = PrefixTable((term, count, None) for term, count in term_counts)
+
+    def suggest(self, prefix: str, limit: int = 8):
+        prefix = " ".join(prefix.casefold().split())
+        if not prefix:
+            return []
+
+        suggestions = []
+        seen_ids = set()
+        # names come back in alphabetical order, so shorter names win ties
+        for _, _, note in self._names.search(prefix, limit * 2, ranked=False):
+            if note["id"] in seen_ids:
+                continue
+            seen_ids.add(note["id"])
+            suggestions.append({"kind": "note", "text": note["title"], "id": note["id"]})
+            if len(suggestions) >= limit // 2:
+                break
+
+        # terms complete the last word typed
+        head, _, last = prefix.rpartition(" ")
+        if last:
+            for term, count, _ in self._terms.search(last, limit - len(suggestions)):
+                text = f"{head} {term}" if head else term
+                suggestions.append({"kind": "term", "text": text, "count": count})
+        return suggestions
@@ -0,0 +1,69 @@
+# summary_cache.py
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+
+def summary_cache_key(versions, prompt: str, model: str, mode: str = "", budget: int = 0) -> str:
+    """
+    `versions` maps item id -> cTag/eTag. The order of the ids does not
+    matter, and a new version of any note gives a different key.
+    """
+    material = json.dumps(
+        {"docs": sorted(versions.items()), "prompt": prompt, "model": model, "mode": mode, "budget": budget},
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """
+    Persistent (JSON file) cache of LLM summaries with a TTL and a cap on the
+    number of entries; the least recently used entries are evicted first.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self._entries = json.load(f)
+            except ValueError:
+                self._entries = {}
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            now = time.time()
+            if now - entry["created_at"] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            entry["last_used"] = now
+            return entry["summary"]
+
+    def put(self, key: str, summary: str):
+        with self._lock:
+            now = time.time()
+            self._entries[key] = {"summary": summary, "created_at": now, "last_used": now}
+            self._entries = {
+                k: e for k, e in self._entries.items() if now - e["created_at"] <= self.ttl_seconds
+            }
+            if len(self._entries) > self.max_entries:
+                keep = sorted(self._entries.items(), key=lambda kv: kv[1]["last_used"], reverse=True)
+                self._entries = dict(keep[: self.max_entries])
+            self._save_locked()
+
+    def _save_locked(self):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
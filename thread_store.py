@@ -0,0 +1,205 @@
+# thread_store.py
+import json
+import base64
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+
+class ThreadStore:
+    """
+    Chat threads in MongoDB. The thread document only holds its metadata
+    ({_id, title, message_count, created_at, updated_at}, plus
+    history_summary/summary_seq once older turns have been summarized for
+    the model, see app_backend.py); every turn is its
+    own document in the messages collection ({thread_id, seq, user,
+    assistant, citations, created_at}), numbered 1, 2, ... per thread, so a
+    long thread neither hits the 16 MB document limit nor has to be loaded
+    whole.
+
+    Threads written by older versions keep their turns in a `conversations`
+    array; they are moved into the messages collection by migrate_all() at
+    startup, or on first use, whichever comes first.
+
+    Thread ids are passed as strings; an invalid one raises
+    bson.errors.InvalidId.
+    """
+
+    def __init__(self, db):
+        self.threads = db["threads"]
+        self.messages = db["messages"]
+
+    def ensure_indexes(self):
+        # serves the sidebar listing (newest first, _id breaks ties)
+        self.threads.create_index([("updated_at", DESCENDING), ("_id", DESCENDING)])
+        self.messages.create_index([("thread_id", ASCENDING), ("seq", ASCENDING)], unique=True)
+
+    # --- migration from the embedded `conversations` array ---
+
+    def migrate_thread(self, doc):
+        conversations = doc.get("conversations")
+        if conversations is None:
+            return
+        created_at = doc.get("updated_at") or doc.get("created_at") or datetime.utcnow()
+        for seq, turn in enumerate(conversations, start=1):
+            # upserts keep a migration that was interrupted halfway safe to re-run
+            self.messages.update_one(
+                {"thread_id": doc["_id"], "seq": seq},
+                {
+                    "$setOnInsert": {
+                        "user": turn.get("user"),
+                        "assistant": turn.get("assistant"),
+                        "citations": turn.get("citations", []),
+                        "created_at": created_at,
+                    }
+                },
+                upsert=True,
+            )
+        self.threads.update_one(
+            {"_id": doc["_id"], "conversations": {"$exists": True}},
+            {"$set": {"message_count": len(conversations)}, "$unset": {"conversations": ""}},
+        )
+
+    def migrate_all(self):
+        migrated = 0
+        for doc in self.threads.find({"conversations": {"$exists": True}}):
+            self.migrate_thread(doc)
+            migrated += 1
+        return migrated
+
+    # --- threads ---
+
+    @staticmethod
+    def encode_list_cursor(doc) -> str:
+        key = {"updated_at": doc["updated_at"].isoformat(), "id": str(doc["_id"])}
+        return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_list_cursor(cursor: str):
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return datetime.fromisoformat(key["updated_at"]), ObjectId(key["id"])
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    def list_page(self, cursor=None, limit: int = 50):
+        """
+        One page of threads, most recently updated first, using keyset
+        pagination on (updated_at, _id) so every page is an index range scan
+        however many threads there are. Returns (threads, next_cursor).
+        """
+        query = {}
+        if cursor:
+            updated_at, oid = self.decode_list_cursor(cursor)
+            query = {
+                "$or": [
+                    {"updated_at": {"$lt": updated_at}},
+                    {"updated_at": updated_at, "_id": {"$lt": oid}},
+                ]
+            }
+        docs = list(
+            self.threads.find(query, {"title": 1, "updated_at": 1})
+            .sort([("updated_at", DESCENDING), ("_id", DESCENDING)])
+            .limit(limit + 1)
+        )
+        next_cursor = self.encode_list_cursor(docs[limit - 1]) if len(docs) > limit else None
+        return docs[:limit], next_cursor
+
+    def create(self, title: str):
+        now = datetime.utcnow()
+        doc = {"title": title, "message_count": 0, "created_at": now, "updated_at": now}
+        doc["_id"] = self.threads.insert_one(doc).inserted_id
+        return doc
+
+    def get(self, thread_id: str):
+        doc = self.threads.find_one({"_id": ObjectId(thread_id)})
+        if doc is not None and "conversations" in doc:
+            self.migrate_thread(doc)
+            doc = self.threads.find_one({"_id": doc["_id"]})
+        return doc
+
+    def rename(self, thread_id: str, title: str) -> bool:
+        result = self.threads.update_one(
+            {"_id": ObjectId(thread_id)},
+            {"$set": {"title": title, "updated_at": datetime.utcnow()}},
+        )
+        return result.matched_count > 0
+
+    def delete(self, thread_id: str) -> bool:
+        oid = ObjectId(thread_id)
+        result = self.threads.delete_one({"_id": oid})
+        self.messages.delete_many({"thread_id": oid})
+        return result.deleted_count > 0
+
+    # --- messages ---
+
+    def append_message(self, thread_id: str, user_text: str, reply: str, citations):
+        """
+        Store one chat turn at the end of the thread. Returns its seq, or
+        None when the thread does not exist.
+        """
+        if self.get(thread_id) is None:
+            return None
+        now = datetime.utcnow()
+        doc = self.threads.find_one_and_update(
+            {"_id": ObjectId(thread_id)},
+            {"$inc": {"message_count": 1}, "$set": {"updated_at": now}},
+            projection={"message_count": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            return None
+        seq = doc["message_count"]
+        self.messages.insert_one(
+            {
+                "thread_id": doc["_id"],
+                "seq": seq,
+                "user": user_text,
+                "assistant": reply,
+                "citations": citations,
+                "created_at": now,
+            }
+        )
+        return seq
+
+    def messages_page(self, thread_id: str, before=None, limit: int = 50):
+        """
+        The latest `limit` turns of a thread, or the ones just before seq
+        `before`, oldest first. Returns (turns, next_cursor) where
+        next_cursor is the `before` value for the previous page, or None at
+        the start of the thread.
+        """
+        query = {"thread_id": ObjectId(thread_id)}
+        if before is not None:
+            query["seq"] = {"$lt": before}
+        docs = list(
+            self.messages.find(query, {"_id": 0, "thread_id": 0})
+            .sort("seq", DESCENDING)
+            .limit(limit + 1)
+        )
+        has_more = len(docs) > limit
+        turns = docs[:limit][::-1]
+        next_cursor = turns[0]["seq"] if has_more and turns else None
+        return turns, next_cursor
+
+    def turns_between(self, thread_id: str, after_seq: int, upto_seq: int):
+        """Turns with after_seq < seq <= upto_seq, oldest first."""
+        return list(
+            self.messages.find(
+                {"thread_id": ObjectId(thread_id), "seq": {"$gt": after_seq, "$lte": upto_seq}},
+                {"_id": 0, "thread_id": 0},
+            ).sort("seq", ASCENDING)
+        )
+
+    def set_history_summary(self, thread_id: str, summary: str, summary_seq: int, previous_seq: int) -> bool:
+        """
+        Store the summary of turns 1..summary_seq, unless another refresh got
+        there first (the stored summary_seq is no longer `previous_seq`).
+        """
+        current = previous_seq if previous_seq else {"$in": [0, None]}
+        result = self.threads.update_one(
+            {"_id": ObjectId(thread_id), "summary_seq": current},
+            {"$set": {"history_summary": summary, "summary_seq": summary_seq}},
+        )
+        return result.matched_count > 0